@@ -1,187 +1,305 @@
 """
 Module xử lý AI cho Smart Home
 Nâng cấp: Thêm LOVE, ROCK, THREE vào bộ nhận diện
+Nâng cấp: Cử chỉ phân loại theo bảng mẫu (gestures.json), hỗ trợ nhiều tay / frame
 """
 import cv2
 import numpy as np
 import mediapipe as mp
 import os
-import json
+import threading
+from face_matcher import FaceMatcher, select_diverse
+from face_store import FaceStore, import_json_db
+from face_tracker import FaceTracker
+from face_features import backend_config, create_embedder, create_face_models, check_face_quality, largest_face_feature
+from gesture_gate import GestureGate
+from gesture_classifier import GestureClassifier, hands_to_array
+from metrics import stage
+
+GESTURE_FILE = "gestures.json"  # Bảng mẫu cử chỉ (thiếu file thì dùng bảng mặc định)
+MAX_HANDS = 2
+
+class ModelLoadError(RuntimeError):
+    """Model AI đã nạp lỗi trước đó (xem status / error): không nạp lại trong request web"""
 
 class SmartHomeAI:
-    def __init__(self):
-        # ============= KHỞI TẠO MEDIAPIPE =============
-        self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(
-            static_image_mode=False,
-            max_num_hands=1,
-            model_complexity=0, 
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-
-        # ============= KHỞI TẠO YUNET & SFACE =============
-        path_detect = "models/face_detection_yunet_2023mar.onnx"
-        path_recog = "models/face_recognition_sface_2021dec.onnx"
-        
-        if not os.path.exists(path_detect) or not os.path.exists(path_recog):
-            print("LỖI: Thiếu file model trong thư mục models/!")
-            
-        self.detector = cv2.FaceDetectorYN.create(
-            model=path_detect, config="", input_size=(320, 320), 
-            score_threshold=0.8, nms_threshold=0.3, top_k=5000
-        )
-        self.recognizer = cv2.FaceRecognizerSF.create(model=path_recog, config="")
-
-        # ============= DATABASE =============
-        self.db_file = "face_db.json"
-        self.face_db = self.load_database()
+    def __init__(self, lazy=False, backend=None, detect_width=320, sweep_interval=10):
+        # Khóa dùng chung cho YuNet/SFace (luồng pipeline và luồng Flask cùng gọi)
+        self.lock = threading.RLock()
+        # Bộ ghi thời gian từng stage (None = tắt). Gắn vào 1 đối tượng có hàm observe(tên, giây)
+        self.timer = None
+        # Khóa đăng ký / xóa người dùng: đọc mẫu cũ -> chọn mẫu -> cập nhật matcher -> ghi face DB là 1 khối
+        self._enroll_lock = threading.Lock()
+        # Biến thể model + DNN backend/target + số luồng (xem face_features.py), None = theo biến môi trường
+        self.backend = backend or backend_config()
+        # YuNet chạy trên ảnh thu nhỏ (detect_width) + chỉ quét ROI quanh mặt đang theo dõi,
+        # quét toàn khung hình mỗi sweep_interval frame. Máy yếu: giảm detect_width / tăng sweep_interval
+        self.detect_width = detect_width
+        self.sweep_interval = sweep_interval
+
+        # ============= CẤU HÌNH DATABASE =============
+        self.db_file = "face_db.bin"
+        self.legacy_db_file = "face_db.json"  # Định dạng cũ, chỉ dùng để chuyển đổi 1 lần
         self.threshold_cosine = 0.30 
+        self.max_templates = 5  # Số mẫu tối đa lưu cho mỗi người
+
+        # Trạng thái nạp model: pending -> loading -> (warming) -> ready, lỗi thì failed
+        self.status = "pending"
+        self.error = None
+        self.ready = False  # True khi đã nạp + chạy thử xong, dùng được
+        self._load_lock = threading.Lock()
+        # lazy=True: chưa tạo model, luồng load_models trong app.py (hoặc lần gọi đầu tiên) mới tạo
+        if not lazy: self.load()
+
+    def load(self, startup=None, warm_up=False):
+        """Tạo MediaPipe / YuNet / SFace + nạp face DB. An toàn khi nhiều luồng cùng gọi, chỉ chạy 1 lần
+        startup: sink ghi thời gian từng bước (vd: metrics.STARTUP), warm_up: chạy thử trên ảnh tổng hợp
+        Đã nạp lỗi 1 lần -> báo ModelLoadError với lỗi đã ghi, không dựng lại model
+        """
+        if self.ready: return
+        with self._load_lock:
+            if self.ready: return
+            if self.status == "failed": raise ModelLoadError(self.error)
+            self.status = "loading"
+            try:
+                # ============= KHỞI TẠO MEDIAPIPE =============
+                with stage(startup, "mediapipe"):
+                    self.mp_hands = mp.solutions.hands
+                    self.hands = self.mp_hands.Hands(
+                        static_image_mode=False,
+                        max_num_hands=MAX_HANDS,
+                        model_complexity=0, 
+                        min_detection_confidence=0.5,
+                        min_tracking_confidence=0.5
+                    )
+                    # Vùng cắt (ROI) đổi kích thước / vị trí mỗi frame: chế độ video sẽ bám theo landmark
+                    # của vùng cũ -> dùng 1 instance riêng ở chế độ ảnh tĩnh (dò lại bàn tay mỗi lần)
+                    self.hands_roi = self.mp_hands.Hands(
+                        static_image_mode=True,
+                        max_num_hands=MAX_HANDS,
+                        model_complexity=0,
+                        min_detection_confidence=0.5
+                    )
+
+                self.gesture_gate = GestureGate(fallback_interval=5)
+                self.gesture_classifier = GestureClassifier.from_json(GESTURE_FILE)
+
+                # ============= KHỞI TẠO YUNET & SFACE =============
+                with stage(startup, "face_models"):
+                    self.detector, self.recognizer, self.scheduler = create_face_models(
+                        detect_width=self.detect_width, sweep_interval=self.sweep_interval, config=self.backend)
+                    # SFace chạy theo lô cho mọi mặt cần nhận diện trong 1 frame
+                    self.embedder = create_embedder(self.recognizer, self.backend)
+
+                # Chạy thử trước khi bật ready: pipeline chưa gọi process_frame nên MediaPipe không bị
+                # dùng song song, chạy thử lỗi thì ready vẫn False (khớp trạng thái failed)
+                if warm_up:
+                    self.status = "warming"
+                    with stage(startup, "warm_up"): self.warm_up()
+
+                # ============= DATABASE =============
+                with stage(startup, "face_db"):
+                    self.matcher = FaceMatcher(threshold=self.threshold_cosine)
+                    self.load_database()
+
+                # ============= TRACKING (BỎ QUA SFACE KHI MẶT ĐÃ BIẾT) =============
+                self.tracker = FaceTracker(threshold=self.threshold_cosine, reverify_interval=15)
+            except Exception as e:
+                self.status, self.error = "failed", str(e)
+                raise
+            self.ready = True
+            self.status = "ready"
+
+    def warm_up(self, frames=2, size=(480, 640)):
+        """Chạy YuNet / SFace / MediaPipe vài lần trên ảnh tổng hợp để frame thật đầu tiên
+        không phải chịu chi phí lần chạy đầu (cấp phát bộ nhớ, khởi tạo backend)"""
+        rng = np.random.default_rng(0)
+        with self.lock:
+            for _ in range(frames):
+                frame = rng.integers(0, 256, size + (3,), dtype=np.uint8)
+                self.scheduler.detect_full(frame)
+                self.recognizer.feature(frame[:112, :112].copy())  # SFace nhận ảnh mặt đã căn chỉnh 112x112
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                self.hands.process(rgb)
+                self.hands_roi.process(rgb[:240, :240].copy())  # Vùng cắt quanh mặt (ROI cử chỉ)
 
     def load_database(self):
-        if not os.path.exists(self.db_file): return {}
+        source = self.db_file  # File đang đọc (để biết file nào hỏng)
         try:
-            with open(self.db_file, 'r') as f:
-                data = json.load(f)
-            db_converted = {}
-            for name, feature_list in data.items():
-                db_converted[name] = np.array(feature_list, dtype=np.float32)
-            return db_converted
-        except: return {}
-
-    def save_database(self):
-        data_to_save = {}
-        for name, feature_array in self.face_db.items():
-            data_to_save[name] = feature_array.tolist()
-        with open(self.db_file, 'w') as f:
-            json.dump(data_to_save, f)
+            self.store = FaceStore(self.db_file)
+            if len(self.store) == 0 and os.path.exists(self.legacy_db_file):
+                source = self.legacy_db_file
+                n = import_json_db(self.legacy_db_file, self.store)
+                print(f">>> Đã chuyển {n} người từ {self.legacy_db_file} sang {self.db_file}")
+                source = self.db_file
+            # Ma trận memmap được dùng thẳng cho bộ so khớp, không parse/copy lúc khởi động
+            # (file .bin bị cắt cụt -> memmap báo lỗi, xử lý như file hỏng)
+            self.matcher.load_matrix(self.store.names, self.store.matrix())
+        except Exception as e:
+            # File hỏng: cất sang bên cạnh để không ghi đè mất, bắt đầu DB trống
+            print(f"Lỗi đọc face DB {source}: {e}")
+            if os.path.exists(source): os.replace(source, source + ".corrupt")
+            self.store = FaceStore(self.db_file)
+            self.matcher.load_matrix(self.store.names, self.store.matrix())
+
+    def reload_database(self):
+        """Nạp lại face DB do tiến trình khác vừa sửa (vd: web đăng ký người mới khi AI chạy ở tiến trình con)"""
+        if not self.ready: return  # Chưa nạp lần nào: lúc nạp sẽ đọc bản mới nhất
+        with self.lock:
+            self.matcher = FaceMatcher(threshold=self.threshold_cosine)
+            self.load_database()
+            self.tracker = FaceTracker(threshold=self.threshold_cosine, reverify_interval=15)
+
+    def stats(self):
+        if not self.ready: return {"status": self.status}
+        return {**self.tracker.stats(), "hands": self.gesture_gate.stats()}
+
+    def list_users(self):
+        self.load()
+        return list(self.matcher.names)
 
     def check_face_quality(self, frame, face_box, landmarks):
-        x, y, w, h = list(map(int, face_box[:4]))
-        if x < 0 or y < 0 or x+w > frame.shape[1] or y+h > frame.shape[0]: return False, "Sat le"
-        face_img = frame[y:y+h, x:x+w]
-        if face_img.size == 0: return False, "Loi cat"
-        
-        gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
-        blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
-        if blur_score < 20: return False, f"Mo ({int(blur_score)})"
-
-        nose_x = landmarks[2][0]
-        right_eye_x = landmarks[0][0]
-        left_eye_x = landmarks[1][0]
-        dist_left = nose_x - right_eye_x
-        dist_right = left_eye_x - nose_x
-        if dist_right == 0: ratio = 0
-        else: ratio = dist_left / dist_right
-
-        if ratio < 0.3 or ratio > 3.0: return False, f"Nghieng ({ratio:.2f})"
-        return True, f"OK ({int(blur_score)})"
-
-    # --- HÀM NHẬN DIỆN CỬ CHỈ (UPDATE 3 CỬ CHỈ MỚI) ---
+        return check_face_quality(frame, face_box, landmarks)
+
+    # --- HÀM NHẬN DIỆN CỬ CHỈ (BẢNG MẪU + VECTOR HÓA, NHIỀU TAY / FRAME) ---
+    def detect_gestures(self, frame_rgb):
+        """Tất cả bàn tay trong frame: danh sách tên cử chỉ theo từng tay"""
+        self.load()
+        with stage(self.timer, "hands"):
+            points, labels = hands_to_array(self.hands.process(frame_rgb))
+        return self.gesture_classifier.classify(points, labels)
+
     def detect_gesture(self, frame_rgb):
-        results = self.hands.process(frame_rgb)
-        gesture = "None"
-        
-        if results.multi_hand_landmarks:
-            for hand_lm in results.multi_hand_landmarks:
-                fingers = [] 
-                # Tips ID: Index(8), Middle(12), Ring(16), Pinky(20)
-                tips = [8, 12, 16, 20]
-                
-                # 1. Check ngón cái (ngang)
-                if hand_lm.landmark[4].x < hand_lm.landmark[3].x: fingers.append(1)
-                else: fingers.append(0)
-                
-                # 2. Check 4 ngón còn lại (dọc)
-                for tip in tips:
-                    if hand_lm.landmark[tip].y < hand_lm.landmark[tip-2].y: fingers.append(1)
-                    else: fingers.append(0)
-                
-                # fingers = [Cái, Trỏ, Giữa, Áp Út, Út]
-                total = fingers.count(1)
-                
-                # Lấy tọa độ Y để check Like/Dislike
-                thumb_tip_y = hand_lm.landmark[4].y
-                thumb_ip_y = hand_lm.landmark[3].y
-                
-                # --- PHÂN LOẠI CỬ CHỈ ---
-                
-                # 1. Bàn tay mở (5 ngón)
-                if total == 5: gesture = "OPEN_HAND"
-                
-                # 2. Nắm đấm (0 ngón) hoặc Dislike
-                elif total == 0: 
-                    if thumb_tip_y > thumb_ip_y + 0.05: gesture = "THUMB_DOWN"
-                    else: gesture = "FIST"
-                
-                # 3. Các cử chỉ 1 ngón
-                elif total == 1:
-                    if fingers[1] == 1: gesture = "POINTING" # Chỉ tay
-                    elif fingers[0] == 1: # Ngón cái
-                        if thumb_tip_y < thumb_ip_y: gesture = "THUMB_UP"
-
-                # 4. Các cử chỉ 2 ngón
-                elif total == 2:
-                    if fingers[1] == 1 and fingers[2] == 1: gesture = "VICTORY" # Chữ V
-                    elif fingers[1] == 1 and fingers[4] == 1: gesture = "ROCK"  # Rock (MỚI)
-
-                # 5. Các cử chỉ 3 ngón
-                elif total == 3:
-                    if fingers[1]==1 and fingers[2]==1 and fingers[3]==1: gesture = "THREE" # Số 3 (MỚI)
-                    elif fingers[0]==1 and fingers[1]==1 and fingers[4]==1: gesture = "LOVE"  # Love (MỚI)
-                    elif fingers[2]==1 and fingers[3]==1 and fingers[4]==1: # OK Sign
-                        dist_thumb_index = abs(hand_lm.landmark[4].x - hand_lm.landmark[8].x)
-                        if dist_thumb_index < 0.05: gesture = "OK_SIGN"
-                
-        return gesture
-
-    def process_frame(self, frame):
-        display_frame = frame.copy()
-        h, w, _ = frame.shape
-        self.detector.setInputSize((w, h))
-
-        _, faces = self.detector.detect(frame)
+        return self._primary(self.detect_gestures(frame_rgb))
+
+    @staticmethod
+    def _primary(gestures):
+        return next((g for g in gestures if g != "None"), "None")
+
+    def detect_gesture_region(self, frame, region):
+        """Chạy MediaPipe trên 1 vùng của frame BGR, landmark được đổi về tọa độ chuẩn hóa
+        của cả khung hình (để luật phân loại giữ nguyên). Trả về (cử chỉ, box bàn tay pixel hoặc None)
+        """
+        h, w = frame.shape[:2]
+        x0, y0, x1, y1 = region
+        crop_rgb = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        points, labels = hands_to_array(self.hands_roi.process(crop_rgb))
+        if not len(points): return "None", None
+
+        points[:, :, 0] = (points[:, :, 0] * (x1 - x0) + x0) / w
+        points[:, :, 1] = (points[:, :, 1] * (y1 - y0) + y0) / h
+        xs, ys = points[:, :, 0] * w, points[:, :, 1] * h
+        hand_box = (float(xs.min()), float(ys.min()), float(xs.max() - xs.min()), float(ys.max() - ys.min()))
+        return self._primary(self.gesture_classifier.classify(points, labels)), hand_box
+
+    def process_frame(self, frame, draw=True):
+        """draw=False: không ai xem video -> bỏ qua copy + vẽ khung/chữ, trả về chính frame gốc"""
+        self.load()
+        t = self.timer
+        display_frame = frame.copy() if draw else frame
         user_name = "Unknown"
-        
-        if faces is not None:
-            for face in faces:
-                box = list(map(int, face[:4]))
+        with self.lock:
+            with stage(t, "detect"):
+                faces = self.scheduler.detect(frame, [tr.box for tr in self.tracker.tracks])
+                tracks = self.tracker.update(faces)
+
+            # Bước 1: Chỉ chạy SFace cho track mới / đến hạn kiểm tra lại / độ tin cậy giảm
+            # Lọc chất lượng + căn chỉnh mọi mặt trước, SFace chạy 1 lần cho cả lô ở bước 2
+            pending, crops = [], []
+            for face, track in zip(faces, tracks):
+                if not self.tracker.needs_recognition(track):
+                    self.tracker.mark_reused()
+                    continue
                 landmarks = face[4:14].reshape((5, 2))
-                is_good, msg = self.check_face_quality(frame, face[:4], landmarks)
+                with stage(t, "quality"):
+                    is_good, msg = self.check_face_quality(frame, face[:4], landmarks)
                 if is_good:
-                    face_align = self.recognizer.alignCrop(frame, face)
-                    face_feature = self.recognizer.feature(face_align)
-                    max_score = 0.0
-                    for name, db_feature in self.face_db.items():
-                        score = self.recognizer.match(face_feature, db_feature, cv2.FaceRecognizerSF_FR_COSINE)
-                        if score > max_score:
-                            max_score = score
-                            if score > self.threshold_cosine: user_name = name
-                    color = (0, 255, 0) if user_name != "Unknown" else (255, 255, 0)
-                    cv2.rectangle(display_frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), color, 2)
-                    cv2.putText(display_frame, f"{user_name} ({max_score:.2f})", (box[0], box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-                else:
-                    cv2.rectangle(display_frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), (0, 0, 255), 1)
-
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        gesture = self.detect_gesture(frame_rgb)
-        if gesture != "None":
-            cv2.putText(display_frame, f"CMD: {gesture}", (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+                    with stage(t, "align"):
+                        crops.append(self.recognizer.alignCrop(frame, face))
+                    pending.append(track)
+
+            # Bước 2: Đặc trưng cả lô (1 lần forward) + so khớp cả lô với gallery bằng 1 phép nhân ma trận
+            # Gán 1-1: 2 mặt không thể cùng là 1 người (kể cả người đang được track khác giữ trong frame)
+            if pending:
+                with stage(t, "feature"):
+                    features = self.embedder.features(crops)
+                held = [tr.name for tr in tracks if tr not in pending and tr.name not in (None, "Unknown")]
+                with stage(t, "match"):
+                    results = self.matcher.assign(features, exclude=held)
+                for track, (name, max_score) in zip(pending, results):
+                    self.tracker.set_identity(track, name, max_score)
+
+            # Người quen cuối cùng trong khung hình (giống thứ tự duyệt khi vẽ)
+            for track in tracks:
+                if track.name not in (None, "Unknown"): user_name = track.name
+
+            # Bước 3: Vẽ theo danh tính đã lưu của từng track
+            if draw:
+                with stage(t, "draw"):
+                    for face, track in zip(faces, tracks):
+                        box = list(map(int, face[:4]))
+                        if track.name is None:
+                            # Chưa từng có ảnh đủ chất lượng để nhận diện
+                            cv2.rectangle(display_frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), (0, 0, 255), 1)
+                            continue
+                        color = (0, 255, 0) if track.name != "Unknown" else (255, 255, 0)
+                        cv2.rectangle(display_frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), color, 2)
+                        cv2.putText(display_frame, f"{track.name} ({track.score:.2f})", (box[0], box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+        # Chỉ chạy MediaPipe khi có người quen, và ưu tiên vùng quanh tay / mặt
+        gesture = "None"
+        known_boxes = [tr.box for tr in tracks if tr.name not in (None, "Unknown")]
+        region = self.gesture_gate.select_region(frame.shape, known_boxes)
+        if region is not None:
+            with stage(t, "hands"):
+                gesture, hand_box = self.detect_gesture_region(frame, region)
+            self.gesture_gate.report(hand_box)
+        if gesture != "None" and draw:
+            with stage(t, "draw"):
+                cv2.putText(display_frame, f"CMD: {gesture}", (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
 
         return display_frame, user_name, gesture
 
+    # ============= ĐĂNG KÝ NHIỀU ẢNH =============
+    def extract_feature(self, frame):
+        """Tìm mặt lớn nhất, kiểm tra chất lượng, trả về (đặc trưng hoặc None, lý do)"""
+        self.load()
+        with self.lock:
+            return largest_face_feature(self.scheduler, self.recognizer, frame, self.timer)
+
+    def enroll_user(self, name, frames):
+        """Đăng ký từ N ảnh: lọc chất lượng từng ảnh, gộp với mẫu cũ,
+        giữ tối đa max_templates mẫu đa dạng nhất cho mỗi người
+        Trả về (số ảnh đạt, [(chỉ số ảnh, lý do) cho ảnh bị loại])
+        """
+        if not FaceStore.is_valid_name(name): return 0, [(-1, "Ten khong hop le")]
+        self.load()
+        features, rejected = [], []
+        for i, frame in enumerate(frames):
+            feature, msg = self.extract_feature(frame)
+            if feature is None: rejected.append((i, msg))
+            else: features.append(feature)
+        if not features: return 0, rejected
+
+        with self._enroll_lock:
+            old_templates = self.matcher.templates(name)
+            templates = select_diverse(np.vstack([old_templates, np.stack(features)]), self.max_templates)
+            # Cập nhật bộ so khớp trước (giải phóng memmap) rồi mới ghi file
+            self.matcher.add(name, templates)
+            if len(old_templates): self.store.replace(name, templates)
+            else: self.store.append(name, templates)
+        with self.lock:
+            self.tracker.forget(name)
+            self.tracker.forget("Unknown")
+        return len(features), rejected
+
     def register_user(self, frame, name):
-        h, w, _ = frame.shape
-        self.detector.setInputSize((w, h))
-        _, faces = self.detector.detect(frame)
-        if faces is not None:
-            face = faces[0]
-            landmarks = face[4:14].reshape((5, 2))
-            is_good, msg = self.check_face_quality(frame, face[:4], landmarks)
-            if not is_good: return False
-            face_align = self.recognizer.alignCrop(frame, face)
-            face_feature = self.recognizer.feature(face_align)
-            self.face_db[name] = face_feature
-            self.save_database()
-            return True
-        return False
\ No newline at end of file
+        return self.enroll_user(name, [frame])[0] > 0
+
+    def delete_user(self, name):
+        self.load()
+        with self._enroll_lock:
+            if not self.matcher.remove(name): return False
+            self.store.remove(name)
+            with self.lock: self.tracker.forget(name)
+            return True
\ No newline at end of file
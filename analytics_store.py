@@ -0,0 +1,153 @@
+"""
+Module thống kê lịch sử điều khiển (analytics) bằng SQLite
+- Không quét lại toàn bộ history_log.csv mỗi lần mở biểu đồ: bộ đếm được cộng dồn
+  theo từng giờ (giờ x người dùng x thiết bị) ngay khi log được ghi thêm
+- Lưu vị trí byte đã đọc trong file CSV: sau khi khởi động lại chỉ đọc phần log mới (catch-up)
+- Truy vấn theo khoảng thời gian / thiết bị chỉ cộng các ô giờ nằm trong khoảng,
+  không phụ thuộc độ dài file log
+"""
+import csv
+import datetime
+import io
+import os
+import sqlite3
+import threading
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def hour_key(dt):
+    """datetime -> số nguyên YYYYMMDDHH (so sánh được, key % 100 = giờ trong ngày)"""
+    return ((dt.year * 100 + dt.month) * 100 + dt.day) * 100 + dt.hour
+
+
+def hour_key_from_text(text):
+    """'2023-12-20 14:30:00' -> 2023122014, None nếu sai định dạng (cắt chuỗi, không cần strptime)"""
+    if len(text) >= 13 and text[4] == "-" and text[7] == "-" and text[10] == " ":
+        digits = text[0:4] + text[5:7] + text[8:10] + text[11:13]
+        if digits.isdigit(): return int(digits)
+    try: return hour_key(datetime.datetime.strptime(text, TIME_FORMAT))
+    except ValueError: return None
+
+
+def parse_time_arg(text, end=False):
+    """Tham số ?from=/&to= dạng 'YYYY-MM-DD' hoặc 'YYYY-MM-DD HH[:MM[:SS]]' -> hour key"""
+    if not text: return None
+    text = text.strip().replace("T", " ")
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d %H", "%Y-%m-%d"):
+        try: dt = datetime.datetime.strptime(text, fmt)
+        except ValueError: continue
+        # Chỉ có ngày: 'to' tính hết ngày đó
+        if end and fmt == "%Y-%m-%d": dt = dt.replace(hour=23)
+        return hour_key(dt)
+    raise ValueError(f"Sai định dạng thời gian: {text}")
+
+
+class AnalyticsStore:
+    def __init__(self, db_path="analytics.db", log_path="history_log.csv", device_of=None):
+        self.db_path = db_path
+        self.log_path = log_path
+        self.device_of = device_of  # Hàm (hành động) -> id thiết bị, dùng cho dòng log cũ chưa có cột thiết bị
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS hourly (
+                hour   INTEGER NOT NULL,   -- YYYYMMDDHH
+                user   TEXT    NOT NULL,
+                device TEXT    NOT NULL,
+                n      INTEGER NOT NULL,
+                PRIMARY KEY (hour, user, device)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_hourly_user ON hourly (user, hour);
+            CREATE INDEX IF NOT EXISTS idx_hourly_device ON hourly (device, hour);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    # ============= TRẠNG THÁI ĐỌC LOG =============
+    def _get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def offset(self):
+        with self._lock: return int(self._get_meta("csv_offset", 0))
+
+    # ============= CẬP NHẬT =============
+    def _parse_rows(self, data):
+        """Các dòng CSV (bytes, đã đủ dòng) -> {(hour, user, device): số lần}"""
+        counts = {}
+        for row in csv.reader(io.StringIO(data.decode("utf-8", errors="replace"))):
+            # row = [Thời gian, Người dùng, Hành động, Phương thức, (Thiết bị)]
+            if len(row) < 3: continue
+            hour = hour_key_from_text(row[0])
+            if hour is None: continue  # Dòng tiêu đề hoặc dòng hỏng
+            device = row[4] if len(row) > 4 and row[4] else (self.device_of(row[2]) if self.device_of else "")
+            key = (hour, row[1], device or "")
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def _apply(self, counts):
+        self.conn.executemany(
+            "INSERT INTO hourly (hour, user, device, n) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (hour, user, device) DO UPDATE SET n = n + excluded.n",
+            [(h, u, d, n) for (h, u, d), n in counts.items()])
+
+    def catch_up(self):
+        """Đọc phần log CSV ghi thêm kể từ lần trước (từ vị trí byte đã lưu), trả về số dòng đã cộng"""
+        with self._lock:
+            if not os.path.exists(self.log_path): return 0
+            offset = int(self._get_meta("csv_offset", 0))
+            size = os.path.getsize(self.log_path)
+            if size < offset:
+                # File log bị thay/cắt ngắn: dựng lại từ đầu
+                print(f">>> {self.log_path} đã thay đổi, dựng lại thống kê")
+                self.conn.execute("DELETE FROM hourly")
+                offset = 0
+            if size == offset: return 0
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            end = data.rfind(b"\n") + 1  # Chỉ lấy các dòng đã ghi xong
+            if not end: return 0
+            counts = self._parse_rows(data[:end])
+            with self.conn:
+                self._apply(counts)
+                self._set_meta("csv_offset", offset + end)
+            return sum(counts.values())
+
+    def log_rotated(self):
+        """Gọi khi file log vừa được xoay vòng (đổi tên): file mới đọc lại từ đầu, giữ nguyên thống kê cũ"""
+        with self._lock, self.conn: self._set_meta("csv_offset", 0)
+
+    def rebuild(self):
+        """Xóa và dựng lại thống kê từ file log hiện tại"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM hourly")
+            self._set_meta("csv_offset", 0)
+        return self.catch_up()
+
+    # ============= TRUY VẤN =============
+    def query(self, start=None, end=None, device=None):
+        """Thống kê theo người dùng, theo giờ trong ngày và theo thiết bị (start/end là hour key, có thể None)"""
+        where, params = [], []
+        if start is not None: where.append("hour >= ?"); params.append(start)
+        if end is not None: where.append("hour <= ?"); params.append(end)
+        if device: where.append("device = ?"); params.append(device)
+        clause = (" WHERE " + " AND ".join(where)) if where else ""
+        with self._lock:
+            users = self.conn.execute(f"SELECT user, SUM(n) FROM hourly{clause} GROUP BY user ORDER BY user", params).fetchall()
+            hours = dict(self.conn.execute(f"SELECT hour % 100, SUM(n) FROM hourly{clause} GROUP BY 1", params).fetchall())
+            devices = self.conn.execute(f"SELECT device, SUM(n) FROM hourly{clause} GROUP BY device ORDER BY device", params).fetchall()
+        return {
+            "users": {"labels": [u for u, _ in users], "data": [n for _, n in users]},
+            "hours": {"labels": [f"{i}h" for i in range(24)], "data": [hours.get(i, 0) for i in range(24)]},
+            "devices": {"labels": [d for d, _ in devices], "data": [n for _, n in devices]},
+        }
+
+    def close(self):
+        with self._lock: self.conn.close()
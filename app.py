@@ -1,224 +1,310 @@
 from flask import Flask, render_template, Response, request, jsonify
 import cv2
 import threading 
-import requests 
 import numpy as np 
 import datetime 
-import csv      
 import os
-import json 
-from ai_core import SmartHomeAI 
+import time
+import atexit
+from metrics import REGISTRY, STARTUP, process_rss_bytes, stage  # Import trước để STARTUP tính cả thời gian import model
+from ai_core import ModelLoadError, SmartHomeAI
+from pipeline import DEFAULT_PROFILE, STREAM_PROFILES, FramePipeline
+from gesture_engine import GestureDebouncer
+from analytics_store import AnalyticsStore, parse_time_arg
+from history_logger import HistoryLogger
+from state_store import StateStore
+from webhook_dispatcher import WebhookDispatcher
+from event_bus import EventBus, sse_message
+from frame_source import FrameSource, load_camera_config
+from inference_pool import InferencePool
+from motion_gate import MotionGate
+
+STARTUP.mark("imports")
 
 app = Flask(__name__)
-ai_system = SmartHomeAI()
-camera = cv2.VideoCapture(0)
+# Model AI chưa tạo ở đây: nạp ở luồng nền cuối file (load_models), web lên ngay không phải chờ
+ai_system = SmartHomeAI(lazy=True)
+ai_system.timer = REGISTRY.sink
 
 # --- CẤU HÌNH IFTTT ---
 IFTTT_KEY = "Dán_Mã_Key_Của_Em_Vào_Đây" 
 IFTTT_URL = "https://maker.ifttt.com/trigger/{event}/with/key/" + IFTTT_KEY
+# Đổi đích gửi lệnh (vd: server giả lập khi test): SMARTHOME_WEBHOOK_URL="http://127.0.0.1:8080/{event}"
+WEBHOOK_URL = os.environ.get("SMARTHOME_WEBHOOK_URL", IFTTT_URL)
 
 # --- FILE DỮ LIỆU ---
 DEVICE_FILE = "devices.json"
 USER_PREF_FILE = "user_prefs.json" 
 HISTORY_FILE = "history_log.csv" # Định nghĩa tên file log cho chuẩn
+ANALYTICS_DB = "analytics.db"    # Bộ đếm thống kê cộng dồn từ HISTORY_FILE
+# Danh sách camera (không có file = 1 webcam số 0), xem frame_source.py. Test tải: trỏ sang file dùng nguồn "synthetic"
+CAMERA_FILE = os.environ.get("SMARTHOME_CAMERA_FILE", "cameras.json")
+REGISTER_SAMPLES = 5     # Số frame chụp khi đăng ký trực tiếp
+REGISTER_INTERVAL = 0.2  # Khoảng cách giữa các frame (giây)
+REGISTER_MAX_SAMPLES = 20  # Giới hạn số frame client được yêu cầu (tránh request chạy quá lâu)
+AI_WARMUP = os.environ.get("SMARTHOME_WARMUP", "1") != "0"  # Chạy thử model trên ảnh giả trước khi báo sẵn sàng
+CAMERA_STALE = 5.0       # Giây không có frame mới thì /healthz báo camera mất tín hiệu
 last_log = "" 
 
-# --- QUẢN LÝ THIẾT BỊ (GLOBAL) ---
-def load_devices():
-    if not os.path.exists(DEVICE_FILE):
-        default_data = [
-            {"id": "light", "name": "Đèn Chính", "status": "OFF", "on_gesture": "OPEN_HAND", "off_gesture": "FIST", "icon": "fa-lightbulb"},
-            {"id": "fan", "name": "Quạt Trần", "status": "OFF", "on_gesture": "POINTING", "off_gesture": "VICTORY", "icon": "fa-fan"}
-        ]
-        with open(DEVICE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(default_data, f, ensure_ascii=False, indent=4)
-        return default_data
-    try:
-        with open(DEVICE_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return []
+# --- THIẾT BỊ (GLOBAL) & SỞ THÍCH CÁ NHÂN (PERSONAL) ---
+DEFAULT_DEVICES = [
+    {"id": "light", "name": "Đèn Chính", "status": "OFF", "on_gesture": "OPEN_HAND", "off_gesture": "FIST", "icon": "fa-lightbulb"},
+    {"id": "fan", "name": "Quạt Trần", "status": "OFF", "on_gesture": "POINTING", "off_gesture": "VICTORY", "icon": "fa-fan"}
+]
 
-def save_devices(data):
-    with open(DEVICE_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, indent=4)
+# Dữ liệu nằm trong RAM (có khóa), ghi xuống đĩa gộp sau 0.5s yên lặng, ghi nguyên tử
+state = StateStore(DEVICE_FILE, USER_PREF_FILE, default_devices=DEFAULT_DEVICES, debounce=0.5, timer=REGISTRY.sink)
+STARTUP.mark("state")
 
-# --- QUẢN LÝ SỞ THÍCH CÁ NHÂN (PERSONAL) ---
-def load_user_prefs():
-    if not os.path.exists(USER_PREF_FILE): return {}
-    try:
-        with open(USER_PREF_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return {}
+# --- KÊNH SỰ KIỆN CHO DASHBOARD (SSE /events) ---
+# Chỉ đẩy phần thay đổi: trạng thái thiết bị, dòng log mới, người dùng / cử chỉ nhận diện được
+events = EventBus(history=500)
+state.listeners.append(events.publish)
+SSE_HEARTBEAT = 15  # Giây, gửi dòng rỗng giữ kết nối khi không có sự kiện
+
+# --- THỐNG KÊ (ANALYTICS) ---
+def device_of_action(action):
+    """Dòng log cũ chưa có cột thiết bị: 'BẬT Quạt Trần' / 'BẬT FAN' -> id thiết bị"""
+    target = action.split(" ", 1)[-1].replace(" ", "").lower()
+    for dev in state.devices_snapshot():
+        if target in (dev["id"].replace(" ", "").lower(), dev["name"].replace(" ", "").lower()): return dev["id"]
+    return action.split(" ", 1)[-1]
 
-def save_user_prefs(data):
-    with open(USER_PREF_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, indent=4)
+analytics = AnalyticsStore(ANALYTICS_DB, HISTORY_FILE, device_of=device_of_action)
+analytics.catch_up()
+STARTUP.mark("analytics")
 
-# Load dữ liệu vào RAM
-devices_list = load_devices()
-user_prefs = load_user_prefs()
+# Log ghi bất đồng bộ theo lô, xoay vòng file khi quá 5MB (file cũ nén .gz)
+history_logger = HistoryLogger(HISTORY_FILE, header=["Thời Gian", "Người Dùng", "Hành Động", "Phương Thức", "Thiết Bị"],
+                               batch_size=50, flush_interval=1.0, fsync_interval=5.0, max_bytes=5 * 1024 * 1024,
+                               on_flush=analytics.catch_up, on_rotate=analytics.log_rotated, timer=REGISTRY.sink)
 
 # --- LOG & IFTTT ---
-def save_history(user, action, method="AI"):
+def save_history(user, action, method="AI", device=""):
     global last_log
     now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    try:
-        file_exists = os.path.isfile(HISTORY_FILE)
-        with open(HISTORY_FILE, mode="a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if not file_exists: writer.writerow(["Thời Gian", "Người Dùng", "Hành Động", "Phương Thức"])
-            writer.writerow([now, user, action, method])
-            last_log = f"{action} bởi {user} ({method})"
-            print(f">>> [LOG] {last_log}")
-    except: pass
-
-def send_ifttt_command(event_name):
-    try: 
-        full_url = IFTTT_URL.format(event=event_name)
-        requests.post(full_url)
-    except: pass
+    # Chỉ đưa vào hàng đợi, luồng ghi nền sẽ ghi xuống đĩa theo lô
+    with stage(REGISTRY.sink, "save_history"):
+        history_logger.log([now, user, action, method, device])
+    last_log = f"{action} bởi {user} ({method})"
+    print(f">>> [LOG] {last_log}")
+    events.publish("log", {"text": last_log, "time": now, "user": user, "action": action, "method": method, "device": device})
+
+# 4 luồng gửi dùng chung 1 session, có timeout + thử lại, gộp lệnh bật/tắt liên tục của cùng thiết bị
+webhooks = WebhookDispatcher(WEBHOOK_URL, workers=4, timeout=(3.05, 5.0), retries=3, timer=REGISTRY.sink)
+
+def send_ifttt_command(dev_id, event_name):
+    webhooks.submit(dev_id, event_name)
 
 # --- HÀM ĐIỀU KHIỂN THIẾT BỊ ---
 def control_device_by_id(dev_id, action, user, method="AI"):
-    global devices_list
-    for dev in devices_list:
-        if dev["id"] == dev_id:
-            if dev["status"] == action: return 
-            
-            dev["status"] = action
-            save_devices(devices_list) 
-            
-            event_name = f"{dev_id}_{'on' if action=='ON' else 'off'}"
-            threading.Thread(target=send_ifttt_command, args=(event_name,)).start()
-            
-            save_history(user, f"{'BẬT' if action=='ON' else 'TẮT'} {dev['name']}", method)
-            return
-
-# --- XỬ LÝ VIDEO ---
-def generate_frames():
-    global devices_list, user_prefs
-    while True:
-        success, frame = camera.read()
-        if not success: break
-        
-        processed_frame, user, gesture = ai_system.process_frame(frame)
-        
-        if user != "Unknown" and gesture != "None":
-            command_executed = False
-            
-            # 1. ƯU TIÊN: Kiểm tra sở thích cá nhân
-            if user in user_prefs:
-                user_rules = user_prefs[user]
-                for dev in devices_list:
-                    dev_id = dev["id"]
-                    if dev_id in user_rules:
-                        prefs = user_rules[dev_id]
-                        if gesture == prefs.get("on"):
-                            control_device_by_id(dev_id, "ON", user, "Personal_Gesture")
-                            command_executed = True
-                        elif gesture == prefs.get("off"):
-                            control_device_by_id(dev_id, "OFF", user, "Personal_Gesture")
-                            command_executed = True
-            
-            # 2. MẶC ĐỊNH: Dùng luật chung
-            if not command_executed:
-                for dev in devices_list:
-                    if gesture == dev["on_gesture"]:
-                        control_device_by_id(dev["id"], "ON", user, "Global_Gesture")
-                    elif gesture == dev["off_gesture"]:
-                        control_device_by_id(dev["id"], "OFF", user, "Global_Gesture")
-        
-        ret, buffer = cv2.imencode('.jpg', processed_frame)
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+    dev = state.set_status(dev_id, action)
+    if dev is None: return  # Không có thiết bị hoặc đã đúng trạng thái
+
+    event_name = f"{dev_id}_{'on' if action=='ON' else 'off'}"
+    send_ifttt_command(dev_id, event_name)
+
+    save_history(user, f"{'BẬT' if action=='ON' else 'TẮT'} {dev['name']}", method, dev_id)
+
+# --- XỬ LÝ KẾT QUẢ AI (CHẠY 1 LẦN / FRAME TRONG PIPELINE) ---
+# Nhãn từng frame đi qua bộ chống rung (mỗi camera 1 bộ): chỉ ra lệnh khi 1 cử chỉ "bắt đầu" (giữ đủ lâu, hết cooldown)
+def make_result_handler(cam):
+    def handle_ai_result(user, gesture):
+        if user != cam["user"]:
+            cam["user"] = user
+            events.publish("presence", {"camera": cam["id"], "user": user})
+        for event in cam["debouncer"].update(user, gesture):
+            events.publish("gesture", {**event.to_dict(), "camera": cam["id"]})
+            if event.kind == "started": dispatch_gesture(event.user, event.gesture, cam["room"])
+    return handle_ai_result
+
+def dispatch_gesture(user, gesture, room=None):
+    # Tra chỉ mục dựng sẵn: luật cá nhân (user, cử chỉ) được ưu tiên, không có thì dùng luật chung
+    # room: phòng của camera, chỉ điều khiển thiết bị cùng phòng hoặc thiết bị không gán phòng
+    if user == "Unknown" or gesture == "None": return
+    actions, method = state.actions_for(user, gesture, room)
+    for dev_id, action in actions:
+        control_device_by_id(dev_id, action, user, method)
+
+# --- XỬ LÝ VIDEO (NHIỀU CAMERA) ---
+# Mỗi camera 1 pipeline chạy nền: Nguồn -> AI -> JPEG, mọi client xem camera đó dùng chung kết quả.
+# "workers" > 0 trong cameras.json: AI chạy ở các tiến trình con, ngược lại chạy ngay trong tiến trình web
+camera_config = load_camera_config(CAMERA_FILE)
+inference_pool = InferencePool(camera_config["workers"]) if camera_config["workers"] > 0 else None
+if inference_pool: atexit.register(inference_pool.close)
+cameras = {}  # id camera -> cấu hình + pipeline + AI + bộ chống rung
+
+for i, cam_config in enumerate(camera_config["cameras"]):
+    if inference_pool: cam_ai = inference_pool.proxy(cam_config["id"])
+    elif i == 0: cam_ai = ai_system
+    else:
+        cam_ai = SmartHomeAI(lazy=True)
+        cam_ai.timer = REGISTRY.sink
+    cam = {**cam_config, "ai": cam_ai, "user": "Unknown",
+           "debouncer": GestureDebouncer(window=7, min_hold=0.3, cooldown=1.5)}
+    # Cổng chuyển động: phòng yên lặng thì AI chỉ chạy thưa (idle), có cử động là chạy lại ngay
+    gate = MotionGate(**cam["motion"]) if cam["motion"] is not False else None
+    cam["pipeline"] = FramePipeline(FrameSource(cam["source"]), cam_ai, on_result=make_result_handler(cam),
+                                    timer=REGISTRY.sink, gate=gate)
+    cameras[cam["id"]] = cam
+default_camera = camera_config["cameras"][0]["id"]
+for cam in cameras.values(): cam["pipeline"].start()
+STARTUP.mark("cameras")
+
+def reload_face_db():
+    """Sau khi đăng ký / xóa người dùng bằng ai_system: các bản SmartHomeAI khác nạp lại face DB"""
+    if inference_pool: inference_pool.reload_database()
+    for cam in cameras.values():
+        if isinstance(cam["ai"], SmartHomeAI) and cam["ai"] is not ai_system: cam["ai"].reload_database()
+
+# --- METRICS (đọc từ các bộ đếm có sẵn, chỉ tính khi có người gọi /metrics) ---
+for outcome in ("ok", "http_error", "error", "retried", "coalesced"):
+    REGISTRY.counter("ifttt_requests_total", lambda o=outcome: webhooks.outcomes[o], "Số lệnh IFTTT theo kết quả", outcome=outcome)
+REGISTRY.gauge("ifttt_pending", webhooks.pending, "Số lệnh IFTTT đang chờ gửi")
+for cam_id, cam in cameras.items():
+    pipe = cam["pipeline"]
+    for q_name, queue in (("infer", pipe.infer_q), ("encode", pipe.encode_q)):
+        REGISTRY.counter("dropped_frames_total", lambda q=queue: q.dropped, "Số frame bị bỏ vì hàng đợi đầy", queue=q_name, camera=cam_id)
+        REGISTRY.gauge("queue_depth", lambda q=queue: len(q), "Số frame đang chờ trong hàng đợi", queue=q_name, camera=cam_id)
+    REGISTRY.counter("frames_captured_total", lambda p=pipe: p.frames_captured, "Số frame đọc từ camera", camera=cam_id)
+    REGISTRY.counter("frames_processed_total", lambda p=pipe: p.frames_processed, "Số frame đã qua AI", camera=cam_id)
+    REGISTRY.counter("pipeline_errors_total", lambda p=pipe: p.errors, "Số lỗi trong luồng AI", camera=cam_id)
+    REGISTRY.counter("frames_skipped_total", lambda p=pipe: p.frames_skipped, "Số frame bỏ qua AI vì không có chuyển động", camera=cam_id)
+    if pipe.gate:
+        for mode in ("active", "idle"):
+            REGISTRY.counter("pipeline_mode_seconds_total", lambda g=pipe.gate, m=mode: g.stats()[f"{m}_seconds"],
+                             "Thời gian ở từng chế độ (active / idle)", mode=mode, camera=cam_id)
+    REGISTRY.gauge("stream_clients", lambda p=pipe: p.clients, "Số client đang xem /video_feed", camera=cam_id)
+    REGISTRY.counter("jpeg_encodes_total", lambda p=pipe: p.jpeg_encodes, "Số lần mã hóa JPEG (mọi profile)", camera=cam_id)
+    REGISTRY.counter("face_recognitions_total", lambda a=cam["ai"]: a.stats().get("recognitions_run", 0), "Số lần chạy SFace", camera=cam_id)
+    REGISTRY.counter("face_recognitions_reused_total", lambda a=cam["ai"]: a.stats().get("recognitions_avoided", 0), "Số lần dùng lại danh tính đã cache", camera=cam_id)
+    REGISTRY.counter("gestures_suppressed_total", lambda d=cam["debouncer"]: d.suppressed, "Số cử chỉ bị chặn bởi cooldown", camera=cam_id)
+if inference_pool: REGISTRY.counter("ai_worker_restarts_total", lambda: inference_pool.restarts, "Số lần khởi động lại tiến trình AI")
+REGISTRY.gauge("history_pending_rows", lambda: history_logger.stats()["pending"], "Số dòng log đang chờ ghi")
+REGISTRY.counter("history_rows_written_total", lambda: history_logger.rows_written, "Số dòng log đã ghi xuống đĩa")
+REGISTRY.gauge("sse_cursor", lambda: events.seq, "Số thứ tự sự kiện SSE mới nhất")
+REGISTRY.gauge("process_threads", threading.active_count, "Số luồng đang chạy trong tiến trình web")
+REGISTRY.gauge("process_resident_memory_bytes", process_rss_bytes, "RAM đang dùng của tiến trình web (RSS)")
 
 # --- API ENDPOINTS ---
 @app.route('/')
 def index(): return render_template('index.html')
 
 @app.route('/video_feed')
-def video_feed(): return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed/<cam_id>')
+def video_feed(cam_id=None):
+    # ?profile=high|medium|low: độ phân giải + chất lượng JPEG + FPS tối đa (mạng yếu chọn low)
+    cam = cameras.get(cam_id or default_camera)
+    if cam is None: return "Không có camera này", 404
+    profile = request.args.get('profile', DEFAULT_PROFILE)
+    if profile not in STREAM_PROFILES: return "Không có profile này", 400
+    return Response(cam["pipeline"].stream(profile), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/cameras')
+def list_cameras():
+    return jsonify({"default": default_camera, "profiles": STREAM_PROFILES, "default_profile": DEFAULT_PROFILE,
+                    "cameras": [{"id": c["id"], "name": c["name"], "room": c["room"]} for c in cameras.values()]})
 
 @app.route('/status')
-def status(): return jsonify({"devices": devices_list, "last_log": last_log})
+def status(): return jsonify({"devices": state.devices_snapshot(), "version": state.version, "last_log": last_log, "ai": {cam_id: camera_stats(cam) for cam_id, cam in cameras.items()}})
+
+@app.route('/healthz')
+def healthz():
+    # 200 khi mọi model AI đã nạp + chạy thử xong, 503 khi đang khởi động / nạp lỗi
+    # Camera không có tín hiệu chỉ được báo ra, không làm hệ thống "chưa sẵn sàng" (web vẫn điều khiển được)
+    models = {"enroll": ai_system.status, **{cam_id: cam["ai"].status for cam_id, cam in cameras.items()}}
+    cams = {}
+    for cam_id, cam in cameras.items():
+        age = cam["pipeline"].frame_age()
+        cams[cam_id] = {"opened": cam["pipeline"].camera.isOpened(), "frame_age": None if age is None else round(age, 2),
+                        "ok": age is not None and age < CAMERA_STALE}
+    ready = all(s == "ready" for s in models.values())
+    body = {"status": "ready" if ready else ("failed" if "failed" in models.values() else "starting"),
+            "models": models, "error": ai_system.error, "backend": ai_system.backend, "cameras": cams,
+            "startup": STARTUP.to_dict()}
+    return jsonify(body), 200 if ready else 503
+
+@app.errorhandler(ModelLoadError)
+def model_load_error(e):
+    # Model nạp lỗi ở luồng nền: trả lỗi đã ghi như /healthz, không dựng lại model trong request
+    return jsonify({"status": "failed", "message": "Model AI nạp lỗi", "error": str(e)}), 503
+
+def camera_stats(cam):
+    gate = cam["pipeline"].gate
+    return {**cam["ai"].stats(), "motion": gate.stats() if gate else None}
+
+def state_snapshot():
+    users = {cam_id: cam["user"] for cam_id, cam in cameras.items()}
+    return {"devices": state.devices_snapshot(), "version": state.version, "last_log": last_log,
+            "user": users[default_camera], "users": users}
+
+@app.route('/events')
+def event_stream():
+    """SSE: gửi snapshot khi mới kết nối (hoặc con trỏ quá cũ), sau đó chỉ gửi sự kiện mới
+    Con trỏ nối lại: header Last-Event-ID (trình duyệt tự gửi) hoặc ?since=<số>"""
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('since')
+    cursor = int(cursor) if cursor and cursor.isdigit() else None
+
+    def generate(cursor):
+        yield "retry: 3000\n\n"
+        while True:
+            pending = events.since(cursor) if cursor is not None else None
+            if pending is None:
+                cursor = events.seq  # Lấy con trỏ trước snapshot: sự kiện đến sau sẽ không bị sót
+                yield sse_message("snapshot", state_snapshot(), cursor)
+                continue
+            for seq, kind, data in pending:
+                yield sse_message(kind, data, seq)
+                cursor = seq
+            if events.wait(cursor, SSE_HEARTBEAT) == cursor: yield ": ping\n\n"
+
+    return Response(generate(cursor), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+    """Metrics dạng text cho Prometheus (tắt bằng SMARTHOME_METRICS=0)"""
+    if not REGISTRY.enabled: return "Metrics đã tắt", 404
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 # --- API MỚI: PHÂN TÍCH DỮ LIỆU (ANALYTICS) ---
 @app.route('/get_analytics')
 def get_analytics():
-    """Đọc file log, đếm dữ liệu và trả về JSON cho biểu đồ"""
-    if not os.path.exists(HISTORY_FILE):
-        return jsonify({"users": {"labels": [], "data": []}, "hours": {"labels": [], "data": []}})
-    
-    user_counts = {}
-    hour_counts = {str(i): 0 for i in range(24)} # Tạo khung 0h -> 23h
-    
+    """Thống kê cho biểu đồ, đọc từ bộ đếm đã cộng dồn (không quét lại file log)
+    Tham số tùy chọn: ?from=YYYY-MM-DD[ HH:MM]&to=YYYY-MM-DD[ HH:MM]&device=<id thiết bị>"""
     try:
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader, None) # Bỏ qua dòng tiêu đề
-            
-            for row in reader:
-                # row = [Time, User, Action, Method]
-                if len(row) < 3: continue
-                
-                # 1. Đếm theo User
-                user = row[1]
-                user_counts[user] = user_counts.get(user, 0) + 1
-                
-                # 2. Đếm theo Giờ
-                try:
-                    time_str = row[0] # VD: 2023-12-20 14:30:00
-                    dt = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-                    hour_counts[str(dt.hour)] += 1
-                except: pass
-                
-    except Exception as e:
-        print(f"Lỗi đọc thống kê: {e}")
-
-    # Chuẩn bị dữ liệu trả về
-    return jsonify({
-        "users": {
-            "labels": list(user_counts.keys()),
-            "data": list(user_counts.values())
-        },
-        "hours": {
-            "labels": [f"{i}h" for i in range(24)],
-            "data": [hour_counts[str(i)] for i in range(24)]
-        }
-    })
+        start = parse_time_arg(request.args.get('from'))
+        end = parse_time_arg(request.args.get('to'), end=True)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    with stage(REGISTRY.sink, "analytics"):
+        analytics.catch_up()  # Dòng log ghi tay / tiến trình khác (nếu có)
+        return jsonify(analytics.query(start, end, request.args.get('device')))
 
 # --- CÁC API KHÁC (GIỮ NGUYÊN) ---
 @app.route('/set_user_pref', methods=['POST'])
 def set_user_pref():
-    global user_prefs
     user = request.form.get('user')
-    dev_id = request.form.get('device_id')
-    
-    if user not in user_prefs: user_prefs[user] = {}
-    user_prefs[user][dev_id] = { "on": request.form.get('on_gesture'), "off": request.form.get('off_gesture') }
-    save_user_prefs(user_prefs)
+    state.set_pref(user, request.form.get('device_id'), request.form.get('on_gesture'), request.form.get('off_gesture'))
     return jsonify({"status": "success", "message": f"Đã lưu cho {user}!"})
 
 @app.route('/get_user_pref', methods=['POST'])
 def get_user_pref():
     user = request.form.get('user')
-    return jsonify(user_prefs.get(user, {}))
+    return jsonify(state.prefs_of(user))
 
 @app.route('/add_device', methods=['POST'])
 def add_device():
-    global devices_list
     dev_id = request.form.get('id')
-    for dev in devices_list:
-        if dev["id"] == dev_id: return jsonify({"status": "fail", "message": "ID tồn tại!"})
-    
     new_dev = {"id": dev_id, "name": request.form.get('name'), "status": "OFF", 
                "on_gesture": request.form.get('on_gesture'), "off_gesture": request.form.get('off_gesture'), 
-               "icon": request.form.get('icon')}
-    devices_list.append(new_dev)
-    save_devices(devices_list)
+               "icon": request.form.get('icon'), "room": request.form.get('room') or None}
+    if not state.add_device(new_dev): return jsonify({"status": "fail", "message": "ID tồn tại!"})
     return jsonify({"status": "success", "message": "Đã thêm!"})
 
 @app.route('/delete_device', methods=['POST'])
 def delete_device():
-    global devices_list
-    dev_id = request.form.get('id')
-    devices_list = [d for d in devices_list if d["id"] != dev_id]
-    save_devices(devices_list)
+    state.delete_device(request.form.get('id'))
     return jsonify({"status": "success", "message": "Đã xóa!"})
 
 @app.route('/toggle_device', methods=['POST'])
@@ -228,38 +314,64 @@ def toggle_device():
 
 @app.route('/register', methods=['POST'])
 def register():
+    # Chụp nhiều frame liên tiếp từ pipeline (mặc định 5 ảnh trong ~1 giây)
     name = request.form.get('name')
-    success, frame = camera.read()
-    if success and ai_system.register_user(frame, name):
-        return jsonify({"status": "success", "message": f"Đã đăng ký: {name}"})
-    return jsonify({"status": "fail"})
+    cam = cameras.get(request.form.get('camera') or default_camera)
+    if cam is None: return jsonify({"status": "fail", "message": "Không có camera này"})
+    try: samples = int(request.form.get('samples', REGISTER_SAMPLES))
+    except (TypeError, ValueError): return jsonify({"status": "fail", "message": "Số ảnh không hợp lệ"}), 400
+    samples = max(1, min(samples, REGISTER_MAX_SAMPLES))
+    frames = []
+    for _ in range(samples):
+        frame = cam["pipeline"].latest_frame()
+        if frame is not None: frames.append(frame)
+        time.sleep(REGISTER_INTERVAL)
+    accepted, rejected = ai_system.enroll_user(name, frames)
+    if accepted:
+        reload_face_db()
+        return jsonify({"status": "success", "message": f"Đã đăng ký: {name} ({accepted}/{len(frames)} ảnh đạt)"})
+    return jsonify({"status": "fail", "message": "Không có ảnh đạt chuẩn: " + ", ".join(msg for _, msg in rejected)})
 
 @app.route('/register_upload', methods=['POST'])
 def register_upload():
-    if 'file' not in request.files: return jsonify({"status": "error"})
+    # Nhận 1 hoặc nhiều ảnh trong cùng 1 request
+    files = request.files.getlist('file')
+    if not files: return jsonify({"status": "error"})
     try:
-        file_bytes = np.frombuffer(request.files['file'].read(), np.uint8)
-        img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-        if ai_system.register_user(img, request.form.get('name')): 
-            return jsonify({"status": "success", "message": "Upload OK"})
-        return jsonify({"status": "fail"})
+        images = [cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR) for f in files]
+        accepted, rejected = ai_system.enroll_user(request.form.get('name'), images)
+        if accepted: 
+            reload_face_db()
+            return jsonify({"status": "success", "message": f"Upload OK ({accepted}/{len(images)} ảnh đạt)"})
+        return jsonify({"status": "fail", "message": "Không có ảnh đạt chuẩn: " + ", ".join(msg for _, msg in rejected)})
+    except ModelLoadError: raise
     except: return jsonify({"status": "error"})
 
 @app.route('/get_users')
-def get_users(): return jsonify({"users": list(ai_system.face_db.keys()), "count": len(ai_system.face_db)})
+def get_users():
+    users = ai_system.list_users()
+    return jsonify({"users": users, "count": len(users)})
 
 @app.route('/delete_user', methods=['POST'])
 def delete_user():
     name = request.form.get('name')
-    if name in ai_system.face_db:
-        del ai_system.face_db[name]
-        ai_system.save_database()
-        global user_prefs
-        if name in user_prefs:
-            del user_prefs[name]
-            save_user_prefs(user_prefs)
+    if ai_system.delete_user(name):
+        state.delete_user(name)
+        reload_face_db()
         return jsonify({"status": "success", "message": "Đã xóa user"})
     return jsonify({"status": "fail"})
 
+# --- NẠP MODEL AI Ở NỀN ---
+# Web + camera chạy ngay; pipeline phát hình gốc tới khi model sẵn sàng, /healthz trả 503 trong lúc đó
+def load_models():
+    local = [ai_system] + [c["ai"] for c in cameras.values() if isinstance(c["ai"], SmartHomeAI) and c["ai"] is not ai_system]
+    for ai in local:
+        try: ai.load(STARTUP if ai is ai_system else None, warm_up=AI_WARMUP)
+        except Exception as e: print(f"Lỗi nạp model AI: {e}")
+    print(STARTUP.report())
+
+STARTUP.mark("app")
+threading.Thread(target=load_models, name="ai-load", daemon=True).start()
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
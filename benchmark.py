@@ -0,0 +1,309 @@
+"""
+Benchmark offline cho pipeline nhận diện (không cần webcam, không mở cửa sổ)
+
+Chức năng:
+- Phát lại 1 file video hoặc 1 thư mục ảnh qua SmartHomeAI.process_frame
+- Đo thêm detect_gesture (toàn khung hình) và register_user nếu bật, thống kê riêng (không lẫn vào stage của frame)
+- Báo cáo độ trễ từng stage (p50/p90/p99), FPS, RAM tối đa (peak RSS)
+- Ghi kết quả ra JSON để so sánh giữa các commit
+- Chế độ --compare A,B: chạy 2 biến thể model (vd fp32 và int8bq) trên cùng các frame,
+  so độ trễ YuNet/SFace và mức khớp kết quả (mặt tìm thấy, cosine đặc trưng, danh tính theo face DB)
+
+Ví dụ:
+    python benchmark.py --video clip.mp4 --out bench.json
+    python benchmark.py --images data/frames --gesture-every 1 --register-every 50
+    python benchmark.py --video clip.mp4 --variant int8bq --threads 2
+    python benchmark.py --video clip.mp4 --compare fp32,int8bq --out compare.json
+    python benchmark.py --video clip.mp4 --compare fp32@640,fp32@320
+    python benchmark.py --video clip.mp4 --detect-width 480 --sweep-interval 5
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from ai_core import SmartHomeAI
+from face_features import IMAGE_EXTS, backend_config, create_face_models
+from face_matcher import FaceMatcher, l2_normalize
+from face_store import FaceStore
+from face_tracker import iou_matrix
+from metrics import SampleRecorder, stage
+
+BENCH_USER = "__benchmark__"  # Tên tạm khi đo register_user, bị xóa khi kết thúc
+
+
+def video_frames(path):
+    cap = cv2.VideoCapture(path)
+    while True:
+        ok, frame = cap.read()
+        if not ok: break
+        yield frame
+    cap.release()
+
+
+def image_frames(folder):
+    for f in sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTS)):
+        yield cv2.imread(os.path.join(folder, f))
+
+
+def iter_frames(video=None, images=None, max_frames=None, loop=False):
+    """Sinh lần lượt các frame BGR từ video hoặc thư mục ảnh"""
+    count = 0
+    while True:
+        produced = False
+        for frame in (video_frames(video) if video else image_frames(images)):
+            if frame is None: continue
+            produced = True
+            yield frame
+            count += 1
+            if max_frames and count >= max_frames: return
+        if not loop or not produced: return
+
+
+def peak_rss_mb():
+    """RAM tối đa của tiến trình (MB), None nếu hệ điều hành không hỗ trợ"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except Exception:
+            return None
+
+
+def summarize(samples):
+    """Giây -> thống kê mili giây cho từng stage"""
+    report = {}
+    for name, values in sorted(samples.items()):
+        ms = np.array(values) * 1000
+        report[name] = {
+            "count": int(len(ms)),
+            "mean_ms": round(float(ms.mean()), 3),
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p90_ms": round(float(np.percentile(ms, 90)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "max_ms": round(float(ms.max()), 3),
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def args_backend(args, variant=None):
+    return backend_config(variant=variant or args.variant, backend=args.backend, target=args.target, threads=args.threads)
+
+
+def isolated_ai(args, folder):
+    """SmartHomeAI chạy trên bản sao face DB trong thư mục tạm: --register-every (hoặc benchmark bị ngắt
+    giữa chừng) không bao giờ ghi / tạo face_db.bin thật"""
+    ai = SmartHomeAI(lazy=True, backend=args_backend(args), detect_width=args.detect_width,
+                     sweep_interval=args.sweep_interval)
+    for attr in ("db_file", "legacy_db_file"):
+        src = getattr(ai, attr)
+        dst = os.path.join(folder, os.path.basename(src))
+        if os.path.exists(src): shutil.copyfile(src, dst)
+        setattr(ai, attr, dst)
+    ai.load()
+    return ai
+
+
+def timed_with(ai, recorder, fn, *args):
+    """Gọi fn với ai.timer = recorder: stage bên trong (detect / feature / hands...) của đăng ký
+    và cử chỉ toàn khung không lẫn vào số liệu của đường xử lý frame"""
+    saved, ai.timer = ai.timer, recorder
+    try: return fn(*args)
+    finally: ai.timer = saved
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as folder:
+        return run_with(args, isolated_ai(args, folder))
+
+
+def run_with(args, ai):
+    recorder = SampleRecorder()
+    gesture_recorder, register_recorder = SampleRecorder(), SampleRecorder()
+    ai.timer = recorder
+
+    frames = iter_frames(args.video, args.images, args.max_frames, args.loop)
+    # Bỏ qua vài frame đầu cho model "nóng máy", không tính vào kết quả
+    for _, frame in zip(range(args.warmup), frames):
+        ai.process_frame(frame)
+    recorder.samples.clear()
+
+    n = 0
+    registered = False
+    start = time.perf_counter()
+    for frame in frames:
+        with stage(recorder, "frame"):
+            ai.process_frame(frame)
+        if args.gesture_every and n % args.gesture_every == 0:
+            with stage(gesture_recorder, "detect_gesture"):
+                timed_with(ai, gesture_recorder, ai.detect_gesture, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if args.register_every and n % args.register_every == 0:
+            with stage(register_recorder, "register"):
+                registered = timed_with(ai, register_recorder, ai.register_user, frame, BENCH_USER) or registered
+        n += 1
+    elapsed = time.perf_counter() - start
+    if registered: ai.delete_user(BENCH_USER)
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "source": args.video or args.images,
+        "frames": n,
+        "seconds": round(elapsed, 3),
+        "fps": round(n / elapsed, 2) if elapsed > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": summarize(recorder.samples),  # Chỉ đường xử lý frame (process_frame)
+        "gesture_stages": summarize(gesture_recorder.samples),
+        "register_stages": summarize(register_recorder.samples),
+        "recognition": ai.tracker.stats(),
+        "hands_gate": ai.gesture_gate.stats(),
+        "environment": environment(ai.backend),
+    }
+
+
+def environment(backend):
+    return {"python": platform.python_version(), "opencv": cv2.__version__,
+            "cpu": platform.processor() or platform.machine(), "threads": cv2.getNumThreads(), "backend": backend}
+
+
+# ============= SO SÁNH 2 BIẾN THỂ MODEL =============
+def parse_variant(spec, args):
+    """"int8bq" hoặc "int8bq@640" -> (biến thể, chiều rộng ảnh đưa vào YuNet)"""
+    variant, _, width = spec.partition("@")
+    return variant, int(width) if width else args.detect_width
+
+
+def compare(args):
+    """Cùng 1 frame qua cả 2 biến thể: YuNet toàn khung hình, ghép mặt theo IoU, SFace trên từng cặp mặt
+    Danh tính tra trong face DB hiện có (mẫu đăng ký bằng model đang dùng)"""
+    variants = args.compare.split(",")
+    models = {}
+    for v in variants:
+        variant, width = parse_variant(v, args)
+        models[v] = create_face_models(detect_width=width, config=args_backend(args, variant))
+    recorders = {v: SampleRecorder() for v in variants}
+    store = FaceStore(args.db)
+    matcher = FaceMatcher(threshold=args.threshold)
+    matcher.load_matrix(store.names, store.matrix())
+
+    a, b = variants
+    faces_found = {v: 0 for v in variants}
+    matched, cosines, same_identity, known = 0, [], 0, 0
+    frames = iter_frames(args.video, args.images, args.max_frames, args.loop)
+    for i, frame in enumerate(frames):
+        if i < args.warmup:
+            for _, _, scheduler in models.values(): scheduler.detect_full(frame)
+            continue
+        faces = {}
+        for v, (_, _, scheduler) in models.items():
+            with stage(recorders[v], "detect"): faces[v] = scheduler.detect_full(frame)
+            faces_found[v] += len(faces[v])
+        if not len(faces[a]) or not len(faces[b]): continue
+
+        ious = iou_matrix(faces[a][:, :4], faces[b][:, :4])
+        for ia, ib in enumerate(ious.argmax(axis=1)):
+            if ious[ia, ib] < 0.5: continue
+            matched += 1
+            features = []
+            for v, face in ((a, faces[a][ia]), (b, faces[b][ib])):
+                recognizer = models[v][1]
+                with stage(recorders[v], "feature"):
+                    features.append(recognizer.feature(recognizer.alignCrop(frame, face)).ravel())
+            fa, fb = l2_normalize(np.stack(features))
+            cosines.append(float(fa @ fb))
+            (name_a, _), (name_b, _) = matcher.match_batch(np.stack(features))
+            same_identity += name_a == name_b
+            known += name_a != "Unknown"
+
+    stages = {v: summarize(r.samples) for v, r in recorders.items()}
+    speedup = {name: round(stages[a][name]["p50_ms"] / stages[b][name]["p50_ms"], 2)
+               for name in ("detect", "feature") if name in stages[a] and name in stages[b] and stages[b][name]["p50_ms"]}
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "source": args.video or args.images,
+        "variants": variants,
+        "stages": stages,
+        "speedup_p50": speedup,  # > 1: biến thể thứ 2 nhanh hơn
+        "faces_found": faces_found,
+        "faces_matched": matched,
+        "feature_cosine": {"mean": round(float(np.mean(cosines)), 4), "min": round(float(np.min(cosines)), 4)} if cosines else None,
+        "identity_agreement": round(same_identity / matched, 4) if matched else None,
+        "identity_known_in_first": known,
+        "environment": environment(args_backend(args)),
+    }
+
+
+def print_compare(result):
+    a, b = result["variants"]
+    print(f">>> So sánh {a} vs {b}: mặt tìm thấy {result['faces_found']}, ghép được {result['faces_matched']} cặp")
+    for name in ("detect", "feature"):
+        if name not in result["stages"][a] or name not in result["stages"][b]: continue
+        sa, sb = result["stages"][a][name], result["stages"][b][name]
+        print(f"    {name:8s} p50 {sa['p50_ms']:8.2f} ms -> {sb['p50_ms']:8.2f} ms | p90 {sa['p90_ms']:8.2f} ms -> {sb['p90_ms']:8.2f} ms")
+    print(f"    Cosine đặc trưng {a}/{b}: {result['feature_cosine']}, cùng danh tính: {result['identity_agreement']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline cho SmartHomeAI")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--video", help="File video để phát lại")
+    src.add_argument("--images", help="Thư mục ảnh (xử lý theo thứ tự tên file)")
+    parser.add_argument("--max-frames", type=int, default=None, help="Số frame tối đa")
+    parser.add_argument("--loop", action="store_true", help="Lặp lại nguồn cho đến khi đủ --max-frames")
+    parser.add_argument("--warmup", type=int, default=10, help="Số frame chạy trước, không tính giờ")
+    parser.add_argument("--gesture-every", type=int, default=0, help="Gọi detect_gesture toàn khung mỗi N frame (0 = tắt)")
+    parser.add_argument("--register-every", type=int, default=0, help="Gọi register_user mỗi N frame (0 = tắt)")
+    parser.add_argument("--variant", default=None, help="Biến thể model fp32 / int8 / int8bq")
+    parser.add_argument("--backend", default=None, help="DNN backend (default / opencv / openvino / cuda)")
+    parser.add_argument("--target", default=None, help="DNN target (cpu / cpu_fp16 / opencl / cuda / cuda_fp16...)")
+    parser.add_argument("--threads", type=int, default=None, help="cv2.setNumThreads (mặc định để OpenCV tự chọn)")
+    parser.add_argument("--detect-width", type=int, default=320, help="Chiều rộng ảnh đưa vào YuNet (0 = giữ nguyên)")
+    parser.add_argument("--sweep-interval", type=int, default=10, help="Số frame giữa 2 lần YuNet quét toàn khung hình")
+    parser.add_argument("--compare", default=None,
+                        help="So sánh 2 biến thể trên cùng frame, vd: fp32,int8bq hoặc fp32@640,fp32@320 (@ = --detect-width riêng)")
+    parser.add_argument("--db", default="face_db.bin", help="Face DB dùng để so danh tính khi --compare")
+    parser.add_argument("--threshold", type=float, default=0.30, help="Ngưỡng cosine nhận diện khi --compare")
+    parser.add_argument("--out", default="bench_result.json", help="File JSON kết quả")
+    args = parser.parse_args()
+    if args.loop and not args.max_frames: parser.error("--loop cần --max-frames")
+    if args.compare and len(args.compare.split(",")) != 2: parser.error("--compare cần đúng 2 biến thể, vd: fp32,int8bq")
+
+    result = compare(args) if args.compare else run(args)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=4)
+    if args.compare:
+        print_compare(result)
+        print(f">>> Đã ghi {args.out}")
+        return
+
+    print(f">>> {result['frames']} frame, {result['fps']} FPS, peak RSS {result['peak_rss_mb']} MB")
+    for group in ("stages", "gesture_stages", "register_stages"):
+        if result[group] and group != "stages": print(f"    [{group}]")
+        for name, st in result[group].items():
+            print(f"    {name:10s} p50 {st['p50_ms']:8.2f} ms | p90 {st['p90_ms']:8.2f} ms | p99 {st['p99_ms']:8.2f} ms | n={st['count']}")
+    print(f">>> Đã ghi {args.out}")
+
+
+if __name__ == "__main__":
+    main()
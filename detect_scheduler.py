@@ -0,0 +1,72 @@
+"""
+Module điều phối YuNet: giảm độ phân giải + chỉ quét vùng quanh mặt đang theo dõi
+- Frame được thu nhỏ về chiều rộng detect_width trước khi đưa vào YuNet, box trả về được phóng lại
+- Khi đang theo dõi mặt: chỉ quét các vùng (ROI) mở rộng quanh từng mặt
+- Cứ sweep_interval frame lại quét toàn khung hình 1 lần để bắt người mới xuất hiện
+"""
+import cv2
+import numpy as np
+
+# Cột tọa độ trong kết quả YuNet: [x, y, w, h, 5 cặp (x, y) landmark, score]
+X_COLS = [0, 4, 6, 8, 10, 12]
+Y_COLS = [1, 5, 7, 9, 11, 13]
+
+
+class DetectionScheduler:
+    def __init__(self, detector, detect_width=320, sweep_interval=10, roi_expand=1.0, nms_threshold=0.3):
+        self.detector = detector
+        self.detect_width = detect_width      # Chiều rộng ảnh đưa vào YuNet (None = giữ nguyên)
+        self.sweep_interval = sweep_interval  # Số frame giữa 2 lần quét toàn khung hình
+        self.roi_expand = roi_expand          # Mở rộng ROI mỗi phía = roi_expand x kích thước mặt
+        self.nms_threshold = nms_threshold
+        self.frame_count = 0
+        self.full_sweeps = 0
+        self.roi_passes = 0
+
+    def _scale(self, w):
+        if not self.detect_width or w <= self.detect_width: return 1.0
+        return self.detect_width / w
+
+    def _detect_region(self, frame, x0, y0, scale):
+        """Chạy YuNet trên 1 vùng ảnh (đã thu nhỏ), trả về box theo tọa độ khung hình gốc"""
+        h, w = frame.shape[:2]
+        if scale != 1.0:
+            frame = cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        self.detector.setInputSize((frame.shape[1], frame.shape[0]))
+        _, faces = self.detector.detect(frame)
+        if faces is None: return np.zeros((0, 15), dtype=np.float32)
+        faces = faces.copy()
+        faces[:, :14] /= scale
+        faces[:, X_COLS] += x0
+        faces[:, Y_COLS] += y0
+        return faces
+
+    def detect_full(self, frame):
+        self.full_sweeps += 1
+        return self._detect_region(frame, 0, 0, self._scale(frame.shape[1]))
+
+    def detect(self, frame, tracked_boxes=()):
+        """Trả về mảng N x 15 giống cv2.FaceDetectorYN.detect (tọa độ khung hình gốc)"""
+        self.frame_count += 1
+        if not len(tracked_boxes) or self.frame_count % self.sweep_interval == 0:
+            return self.detect_full(frame)
+
+        h, w = frame.shape[:2]
+        scale = self._scale(w)
+        found = []
+        for bx, by, bw, bh in tracked_boxes:
+            x0, y0 = max(0, int(bx - bw * self.roi_expand)), max(0, int(by - bh * self.roi_expand))
+            x1, y1 = min(w, int(bx + bw * (1 + self.roi_expand))), min(h, int(by + bh * (1 + self.roi_expand)))
+            if (x1 - x0) * scale < 16 or (y1 - y0) * scale < 16: continue
+            self.roi_passes += 1
+            found.append(self._detect_region(frame[y0:y1, x0:x1], x0, y0, scale))
+        faces = np.vstack(found) if found else np.zeros((0, 15), dtype=np.float32)
+
+        # Các ROI chồng nhau có thể thấy cùng 1 mặt -> lọc trùng bằng NMS
+        if len(found) > 1 and len(faces) > 1:
+            keep = cv2.dnn.NMSBoxes(faces[:, :4].tolist(), faces[:, 14].tolist(), 0.0, self.nms_threshold)
+            faces = faces[np.array(keep, dtype=int).ravel()]
+        return faces
+
+    def stats(self):
+        return {"full_sweeps": self.full_sweeps, "roi_passes": self.roi_passes}
@@ -0,0 +1,44 @@
+"""
+Module chỉ mục điều phối cử chỉ -> hành động thiết bị
+Luật cá nhân và luật chung được biên dịch sẵn thành bảng tra:
+    (người dùng, cử chỉ) -> [(id thiết bị, "ON"/"OFF"), ...]
+    cử chỉ              -> [(id thiết bị, "ON"/"OFF"), ...]
+Mỗi lần ra cử chỉ chỉ tốn 1-2 lần tra dict, không phụ thuộc số thiết bị / số luật.
+Chỉ dựng lại khi cấu hình thay đổi (thêm/xóa thiết bị, sửa sở thích, xóa người dùng).
+Thiết bị có "room" chỉ nhận lệnh từ camera cùng phòng; thiết bị không gán phòng nhận từ mọi camera.
+"""
+
+
+class DispatchIndex:
+    def __init__(self):
+        self.personal = {}   # (user, gesture) -> [(dev_id, action, room)]
+        self.general = {}    # gesture -> [(dev_id, action, room)]
+        self.version = -1    # Phiên bản cấu hình đã dùng để dựng chỉ mục
+
+    def rebuild(self, devices, prefs, version):
+        """Giữ đúng thứ tự và ưu tiên của luật cũ: duyệt thiết bị theo thứ tự, 'on' xét trước 'off'"""
+        personal, general = {}, {}
+        for dev in devices:
+            dev_id, room = dev["id"], dev.get("room") or None
+            on, off = dev.get("on_gesture"), dev.get("off_gesture")
+            if on: general.setdefault(on, []).append((dev_id, "ON", room))
+            if off and off != on: general.setdefault(off, []).append((dev_id, "OFF", room))
+            for user, rules in prefs.items():
+                rule = rules.get(dev_id)
+                if not rule: continue
+                if rule.get("on"): personal.setdefault((user, rule["on"]), []).append((dev_id, "ON", room))
+                if rule.get("off") and rule.get("off") != rule.get("on"):
+                    personal.setdefault((user, rule["off"]), []).append((dev_id, "OFF", room))
+        self.personal, self.general, self.version = personal, general, version
+
+    @staticmethod
+    def _in_room(actions, room):
+        return [(dev_id, action) for dev_id, action, dev_room in actions
+                if room is None or dev_room is None or dev_room == room]
+
+    def lookup(self, user, gesture, room=None):
+        """Trả về ([(id thiết bị, hành động)], phương thức): luật cá nhân được ưu tiên hơn luật chung
+        room = phòng của camera thấy cử chỉ (None = không giới hạn)"""
+        actions = self._in_room(self.personal.get((user, gesture), ()), room)
+        if actions: return actions, "Personal_Gesture"
+        return self._in_room(self.general.get(gesture, ()), room), "Global_Gesture"
@@ -0,0 +1,190 @@
+"""
+Đăng ký khuôn mặt hàng loạt từ thư mục ảnh (không cần chạy web)
+
+Cấu trúc thư mục: <thư mục gốc>/<tên người>/*.jpg  (cho phép thư mục con bên trong)
+- Đọc ảnh + dò mặt + kiểm tra chất lượng + trích đặc trưng SFace chạy song song nhiều tiến trình
+- Mỗi người giữ tối đa --max-templates mẫu đa dạng nhất, ghi vào face_db.bin theo lô (1 lần ghi / lô)
+- Chạy lại được (resumable): file manifest lưu dấu vân tay ảnh của từng người đã xong,
+  người không đổi ảnh sẽ được bỏ qua; dừng giữa chừng thì lần sau làm tiếp phần còn lại
+- Idempotent: thư mục là nguồn dữ liệu chuẩn, chạy lại cho cùng kết quả (mẫu cũ được thay)
+- Đổi model SFace (kể cả đổi biến thể fp32 / int8bq) -> manifest nhận ra model mới và tính lại toàn bộ (hoặc ép bằng --reembed)
+- In báo cáo từng ảnh bị loại (và ghi CSV nếu có --report)
+
+Ví dụ:
+    python enroll_cli.py data/staff
+    python enroll_cli.py data/staff --workers 8 --report rejected.csv
+    python enroll_cli.py data/staff --reembed
+Lưu ý: app.py đang chạy cần khởi động lại để nạp dữ liệu mới.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from face_features import IMAGE_EXTS, backend_config, create_face_models, largest_face_feature, model_paths
+from face_matcher import select_diverse
+from face_store import FaceStore
+from state_store import load_json, write_json_atomic
+
+_models = None  # (detector, recognizer, scheduler) riêng của từng tiến trình con
+
+
+# ============= QUÉT THƯ MỤC =============
+def scan(root):
+    """{tên người: [đường dẫn ảnh tương đối]} + danh sách thư mục có tên không hợp lệ"""
+    people, invalid = {}, []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if not os.path.isdir(folder): continue
+        if not FaceStore.is_valid_name(name):
+            invalid.append(name)
+            continue
+        files = []
+        for dirpath, _, filenames in os.walk(folder):
+            files += [os.path.relpath(os.path.join(dirpath, f), root) for f in filenames if f.lower().endswith(IMAGE_EXTS)]
+        if files: people[name] = sorted(files)
+    return people, invalid
+
+
+def files_signature(root, files):
+    """Dấu vân tay của tập ảnh 1 người (đường dẫn + dung lượng + thời gian sửa)"""
+    h = hashlib.sha1()
+    for rel in files:
+        st = os.stat(os.path.join(root, rel))
+        h.update(f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def model_signature(config):
+    parts = []
+    for path in model_paths(config):
+        parts.append(f"{os.path.basename(path)}:{os.path.getsize(path) if os.path.exists(path) else 0}")
+    return "|".join(parts)
+
+
+# ============= TIẾN TRÌNH CON =============
+def _init_worker(detect_width, config):
+    global _models
+    # config["threads"] = 1: song song theo tiến trình, tránh mỗi tiến trình lại mở nhiều luồng OpenCV
+    _models = create_face_models(detect_width=detect_width, config=config)
+
+
+def _process(task):
+    name, root, rel = task
+    _, recognizer, scheduler = _models
+    frame = cv2.imread(os.path.join(root, rel))
+    feature, msg = largest_face_feature(scheduler, recognizer, frame)
+    return name, rel, None if feature is None else feature.astype(np.float32), msg
+
+
+# ============= CHẠY =============
+def run(args):
+    root = args.root
+    people, invalid = scan(root)
+    manifest_path = args.manifest or os.path.join(root, "enroll_manifest.json")
+    manifest = load_json(manifest_path, {})
+    config = backend_config(variant=args.variant, threads=1)
+    model = model_signature(config)
+    # Đổi model: mẫu cũ trong DB không so sánh được với mẫu mới -> không gộp, không giữ lại
+    reembed = manifest.get("model") != model or args.reembed
+    if reembed:
+        manifest = {"model": model, "people": {}}
+        if args.merge: print(">>> Tính lại toàn bộ (đổi model / --reembed): bỏ qua --merge, không gộp mẫu của model cũ")
+    done = manifest.setdefault("people", {})
+
+    store = FaceStore(args.db)
+    in_store = set(store.names)
+    todo = {}
+    for name, files in people.items():
+        sig = files_signature(root, files)
+        entry = done.get(name)
+        if entry and entry["signature"] == sig and (name in in_store or not entry["accepted"]): continue
+        todo[name] = (sig, files)
+
+    for name in invalid: print(f"Bỏ qua thư mục tên không hợp lệ: {name!r}")
+    total = sum(len(files) for _, files in todo.values())
+    print(f">>> {len(people)} người, {len(people) - len(todo)} đã xong trước đó, cần xử lý {len(todo)} người / {total} ảnh")
+    if not todo: return 0, []
+
+    remaining = {name: len(files) for name, (_, files) in todo.items()}
+    features = {name: [] for name in todo}
+    rejected_by = {name: [] for name in todo}
+    report, batch, failed, finished = [], {}, [], 0
+    start = time.perf_counter()
+
+    def commit():
+        # 1 lần ghi face DB cho cả lô, sau đó mới lưu manifest (dừng giữa chừng thì lô đó làm lại)
+        if batch: store.put_many(batch)
+        batch.clear()
+        write_json_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=1))
+
+    tasks = [(name, root, rel) for name, (_, files) in todo.items() for rel in files]
+    with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(args.detect_width, config)) as pool:
+        for name, rel, feature, msg in pool.imap_unordered(_process, tasks, chunksize=4):
+            if feature is None:
+                rejected_by[name].append([rel, msg])
+                report.append((name, rel, msg))
+            else:
+                features[name].append(feature)
+            finished += 1
+            if finished % 100 == 0:
+                print(f"    {finished}/{total} ảnh ({finished / (time.perf_counter() - start):.1f} ảnh/s)")
+
+            remaining[name] -= 1
+            if remaining[name]: continue
+            # Xong toàn bộ ảnh của 1 người
+            feats = features.pop(name)
+            if feats:
+                base = store.templates(name) if args.merge and not reembed else np.zeros((0, feats[0].shape[0]), dtype=np.float32)
+                batch[name] = select_diverse(np.vstack([base, np.stack(feats)]), args.max_templates)
+            elif name in in_store and (reembed or not args.merge):
+                # Không còn ảnh nào đạt: xóa mẫu cũ (của model cũ / bộ ảnh cũ) thay vì để lẫn vào gallery
+                batch[name] = np.zeros((0, store.dim), dtype=np.float32)
+                failed.append(name)
+            done[name] = {"signature": todo[name][0], "accepted": len(feats), "rejected": rejected_by.pop(name)}
+            if len(batch) >= args.batch: commit()
+    commit()
+
+    elapsed = time.perf_counter() - start
+    accepted = sum(done[name]["accepted"] for name in todo)
+    print(f">>> Xong {total} ảnh trong {elapsed:.1f}s: {accepted} đạt, {len(report)} bị loại")
+    for name in failed: print(f"    [THẤT BẠI] {name}: không có ảnh đạt, đã xóa mẫu cũ khỏi face DB")
+    if reembed:
+        stale = sorted(set(store.names) - set(people))
+        if stale: print(f"    [CẢNH BÁO] Còn mẫu của model cũ (không có thư mục ảnh để tính lại): {', '.join(stale)}")
+    return accepted, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đăng ký khuôn mặt hàng loạt (mỗi người 1 thư mục)")
+    parser.add_argument("root", help="Thư mục gốc, mỗi thư mục con là 1 người")
+    parser.add_argument("--db", default="face_db.bin", help="File face DB")
+    parser.add_argument("--manifest", default=None, help="File manifest (mặc định <root>/enroll_manifest.json)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Số tiến trình xử lý ảnh")
+    parser.add_argument("--detect-width", type=int, default=640, help="Chiều rộng ảnh khi chạy YuNet")
+    parser.add_argument("--variant", default=None, help="Biến thể model fp32 / int8 / int8bq (mặc định theo SMARTHOME_MODEL_VARIANT)")
+    parser.add_argument("--max-templates", type=int, default=5, help="Số mẫu tối đa mỗi người")
+    parser.add_argument("--batch", type=int, default=20, help="Số người mỗi lần ghi face DB")
+    parser.add_argument("--merge", action="store_true", help="Gộp với mẫu đang có trong DB thay vì thay thế")
+    parser.add_argument("--reembed", action="store_true", help="Bỏ qua manifest, tính lại toàn bộ (vd: sau khi đổi model)")
+    parser.add_argument("--report", default=None, help="Ghi danh sách ảnh bị loại ra file CSV")
+    args = parser.parse_args()
+
+    _, report = run(args)
+    for name, rel, msg in report: print(f"    [LOẠI] {name}: {rel} -> {msg}")
+    if args.report:
+        with open(args.report, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Người", "Ảnh", "Lý do"])
+            writer.writerows(report)
+        print(f">>> Đã ghi {args.report}")
+
+
+if __name__ == "__main__":
+    main()
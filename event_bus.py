@@ -0,0 +1,43 @@
+"""
+Module kênh sự kiện cho dashboard (Server-Sent Events)
+- Mỗi sự kiện (thiết bị đổi trạng thái, dòng log mới, người dùng / cử chỉ được nhận diện)
+  được đánh số thứ tự tăng dần: số này là con trỏ (cursor) để client nối lại
+- Giữ 1 vòng đệm các sự kiện gần nhất: client mất kết nối ngắn chỉ nhận phần còn thiếu,
+  con trỏ quá cũ thì client phải tải lại ảnh chụp toàn bộ trạng thái (snapshot)
+"""
+import json
+import threading
+from collections import deque
+
+
+class EventBus:
+    def __init__(self, history=500):
+        self.seq = 0
+        self._events = deque(maxlen=history)  # (seq, loại, dữ liệu)
+        self._cond = threading.Condition()
+
+    def publish(self, kind, data):
+        with self._cond:
+            self.seq += 1
+            self._events.append((self.seq, kind, data))
+            self._cond.notify_all()
+            return self.seq
+
+    def since(self, cursor):
+        """Các sự kiện sau con trỏ, None nếu con trỏ đã rơi khỏi vòng đệm (cần snapshot)"""
+        with self._cond:
+            if cursor > self.seq: return None  # Con trỏ của lần chạy server trước
+            if self._events and cursor < self._events[0][0] - 1: return None
+            return [e for e in self._events if e[0] > cursor]
+
+    def wait(self, cursor, timeout):
+        """Chờ tới khi có sự kiện mới hơn con trỏ (hoặc hết thời gian)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > cursor, timeout=timeout)
+            return self.seq
+
+
+def sse_message(kind, data, seq=None):
+    """Định dạng 1 sự kiện SSE (id = con trỏ, trình duyệt tự gửi lại qua Last-Event-ID)"""
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,156 @@
+"""
+Module trích đặc trưng khuôn mặt (YuNet + SFace) dùng chung
+Không phụ thuộc MediaPipe: dùng được cả trong SmartHomeAI lẫn các tiến trình con của enroll_cli.py
+
+Cấu hình suy luận (tham số > biến môi trường > mặc định):
+- SMARTHOME_MODEL_VARIANT: fp32 (mặc định) | int8 | int8bq  (file ONNX từ OpenCV Zoo, đặt trong models/)
+  int8bq = lượng tử hóa INT8 theo khối, cần OpenCV >= 4.10; đặc trưng SFace lệch nhẹ so với fp32
+  -> kiểm tra bằng "python benchmark.py --compare fp32,int8bq ..." trước khi đổi
+- SMARTHOME_DNN_BACKEND / SMARTHOME_DNN_TARGET: xem BACKENDS / TARGETS (vd: opencv + cpu, cuda + cuda_fp16)
+- SMARTHOME_THREADS: số luồng OpenCV (cv2.setNumThreads), không đặt = để OpenCV tự chọn
+"""
+import os
+
+import cv2
+import numpy as np
+
+from detect_scheduler import DetectionScheduler
+from face_matcher import l2_normalize
+from metrics import stage
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+MODEL_VARIANTS = {
+    "fp32": ("models/face_detection_yunet_2023mar.onnx", "models/face_recognition_sface_2021dec.onnx"),
+    "int8": ("models/face_detection_yunet_2023mar_int8.onnx", "models/face_recognition_sface_2021dec_int8.onnx"),
+    "int8bq": ("models/face_detection_yunet_2023mar_int8bq.onnx", "models/face_recognition_sface_2021dec_int8bq.onnx"),
+}
+MODEL_DETECT, MODEL_RECOG = MODEL_VARIANTS["fp32"]
+BACKENDS = {"default": cv2.dnn.DNN_BACKEND_DEFAULT, "opencv": cv2.dnn.DNN_BACKEND_OPENCV,
+            "openvino": cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE, "cuda": cv2.dnn.DNN_BACKEND_CUDA}
+TARGETS = {"cpu": cv2.dnn.DNN_TARGET_CPU, "cpu_fp16": cv2.dnn.DNN_TARGET_CPU_FP16, "opencl": cv2.dnn.DNN_TARGET_OPENCL,
+           "opencl_fp16": cv2.dnn.DNN_TARGET_OPENCL_FP16, "cuda": cv2.dnn.DNN_TARGET_CUDA, "cuda_fp16": cv2.dnn.DNN_TARGET_CUDA_FP16}
+
+
+def backend_config(variant=None, backend=None, target=None, threads=None):
+    """Cấu hình suy luận đã kiểm tra hợp lệ: {"variant", "backend", "target", "threads"}"""
+    env = os.environ.get
+    if threads is None and env("SMARTHOME_THREADS"): threads = int(env("SMARTHOME_THREADS"))
+    config = {"variant": variant or env("SMARTHOME_MODEL_VARIANT", "fp32"),
+              "backend": backend or env("SMARTHOME_DNN_BACKEND", "default"),
+              "target": target or env("SMARTHOME_DNN_TARGET", "cpu"),
+              "threads": threads}
+    for key, table in (("variant", MODEL_VARIANTS), ("backend", BACKENDS), ("target", TARGETS)):
+        if config[key] not in table: raise ValueError(f"{key} không hợp lệ: {config[key]!r} (chọn: {', '.join(table)})")
+    return config
+
+
+def model_paths(config=None):
+    """(file YuNet, file SFace) của biến thể đang cấu hình"""
+    return MODEL_VARIANTS[(config or backend_config())["variant"]]
+
+
+def create_face_models(detect_width=320, sweep_interval=10, config=None):
+    """Tạo (detector YuNet, recognizer SFace, scheduler chạy YuNet trên ảnh thu nhỏ)
+    config: kết quả backend_config() (None = đọc từ biến môi trường). Số luồng OpenCV áp dụng cho cả tiến trình
+    """
+    config = config or backend_config()
+    detect_path, recog_path = model_paths(config)
+    if not os.path.exists(detect_path) or not os.path.exists(recog_path):
+        print(f"LỖI: Thiếu file model {config['variant']} trong thư mục models/! ({detect_path}, {recog_path})")
+    if config["threads"] is not None: cv2.setNumThreads(config["threads"])
+    backend_id, target_id = BACKENDS[config["backend"]], TARGETS[config["target"]]
+    detector = cv2.FaceDetectorYN.create(
+        model=detect_path, config="", input_size=(320, 320),
+        score_threshold=0.8, nms_threshold=0.3, top_k=5000, backend_id=backend_id, target_id=target_id
+    )
+    recognizer = cv2.FaceRecognizerSF.create(model=recog_path, config="", backend_id=backend_id, target_id=target_id)
+    scheduler = DetectionScheduler(detector, detect_width=detect_width, sweep_interval=sweep_interval)
+    return detector, recognizer, scheduler
+
+
+class BatchEmbedder:
+    """Đặc trưng SFace cho nhiều mặt đã căn chỉnh trong 1 lần forward (cv2.dnn + blobFromImages)
+    Tiền xử lý giống FaceRecognizerSF.feature: ảnh 112x112, đổi BGR -> RGB, không trừ mean / scale.
+    Lần chạy lô đầu tiên được đối chiếu với kết quả từng mặt; model không nhận batch > 1
+    hoặc kết quả lệch thì quay về chạy từng mặt bằng recognizer.
+    """
+
+    def __init__(self, recognizer, net=None):
+        self.recognizer = recognizer
+        self.net = net          # None = chỉ chạy từng mặt
+        self.verified = False
+        self.batches = 0        # Số lần forward theo lô
+
+    def _single(self, crops):
+        return np.stack([self.recognizer.feature(crop).ravel() for crop in crops])
+
+    def features(self, crops):
+        """Ma trận N x 128 cho N ảnh mặt đã alignCrop"""
+        if self.net is None or len(crops) == 1: return self._single(crops)
+        try:
+            self.net.setInput(cv2.dnn.blobFromImages(crops, 1.0, (112, 112), (0, 0, 0), swapRB=True, crop=False))
+            out = self.net.forward().reshape(len(crops), -1)
+            if not self.verified:
+                single = self.recognizer.feature(crops[0]).ravel()
+                if float(l2_normalize(out[0]) @ l2_normalize(single).T) < 0.999: raise ValueError("lệch so với chạy từng mặt")
+                self.verified = True
+            self.batches += 1
+            return out
+        except (cv2.error, ValueError) as e:
+            print(f"SFace không chạy theo lô được, dùng từng mặt: {e}")
+            self.net = None
+            return self._single(crops)
+
+
+def create_embedder(recognizer, config=None):
+    """BatchEmbedder dùng cùng file SFace + backend/target với recognizer"""
+    config = config or backend_config()
+    try:
+        net = cv2.dnn.readNet(model_paths(config)[1])
+        net.setPreferableBackend(BACKENDS[config["backend"]])
+        net.setPreferableTarget(TARGETS[config["target"]])
+    except cv2.error as e:
+        print(f"Không nạp được SFace cho chế độ lô: {e}")
+        net = None
+    return BatchEmbedder(recognizer, net)
+
+
+def check_face_quality(frame, face_box, landmarks):
+    x, y, w, h = list(map(int, face_box[:4]))
+    if x < 0 or y < 0 or x+w > frame.shape[1] or y+h > frame.shape[0]: return False, "Sat le"
+    face_img = frame[y:y+h, x:x+w]
+    if face_img.size == 0: return False, "Loi cat"
+
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    # Laplacian của ảnh 8-bit nằm gọn trong int16 (chính xác, nhanh hơn float64); phương sai = std^2
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    blur_score = float(std[0, 0]) ** 2
+    if blur_score < 20: return False, f"Mo ({int(blur_score)})"
+
+    nose_x = landmarks[2][0]
+    right_eye_x = landmarks[0][0]
+    left_eye_x = landmarks[1][0]
+    dist_left = nose_x - right_eye_x
+    dist_right = left_eye_x - nose_x
+    if dist_right == 0: ratio = 0
+    else: ratio = dist_left / dist_right
+
+    if ratio < 0.3 or ratio > 3.0: return False, f"Nghieng ({ratio:.2f})"
+    return True, f"OK ({int(blur_score)})"
+
+
+def largest_face_feature(scheduler, recognizer, frame, timer=None):
+    """Tìm mặt lớn nhất, kiểm tra chất lượng, trả về (đặc trưng hoặc None, lý do)"""
+    if frame is None: return None, "Loi anh"
+    with stage(timer, "detect"):
+        faces = scheduler.detect_full(frame)
+    if not len(faces): return None, "Khong thay mat"
+    face = max(faces, key=lambda f: f[2] * f[3])
+    landmarks = face[4:14].reshape((5, 2))
+    with stage(timer, "quality"):
+        is_good, msg = check_face_quality(frame, face[:4], landmarks)
+    if not is_good: return None, msg
+    with stage(timer, "align"):
+        face_align = recognizer.alignCrop(frame, face)
+    with stage(timer, "feature"):
+        return recognizer.feature(face_align).ravel(), msg
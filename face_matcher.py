@@ -0,0 +1,207 @@
+"""
+Module so khớp khuôn mặt dạng vector hóa
+Toàn bộ gallery (đặc trưng SFace đã chuẩn hóa L2) nằm trong 1 ma trận float32 liền mạch,
+mỗi probe (hoặc cả lô probe của 1 frame) chỉ cần 1 phép nhân ma trận.
+Mỗi người có thể có nhiều mẫu (template), điểm của người đó = điểm cao nhất trong các mẫu.
+"""
+import threading
+
+import numpy as np
+
+
+def l2_normalize(features):
+    features = np.asarray(features, dtype=np.float32)
+    if features.ndim == 1: features = features[None, :]
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, 1e-12)
+
+
+def select_diverse(features, max_count):
+    """Chọn tối đa max_count mẫu đa dạng nhất (farthest-point):
+    bắt đầu từ mẫu gần tâm nhất, sau đó lần lượt lấy mẫu ít giống nhất với các mẫu đã chọn
+    """
+    features = l2_normalize(features)
+    if len(features) <= max_count: return features
+    sims = features @ features.T
+    chosen = [int(np.argmax(sims.mean(axis=1)))]
+    closest = sims[chosen[0]].copy()  # Độ giống cao nhất của từng mẫu với tập đã chọn
+    while len(chosen) < max_count:
+        closest[chosen] = np.inf
+        nxt = int(np.argmin(closest))
+        chosen.append(nxt)
+        closest = np.maximum(closest, sims[nxt])
+    return features[chosen]
+
+
+class FaceMatcher:
+    def __init__(self, threshold=0.30, dim=128):
+        self.threshold = threshold
+        self.dim = dim
+        self.names = []           # Danh sách người dùng (theo thứ tự đăng ký)
+        self._index = {}          # Tên -> chỉ số người
+        self._gallery = np.zeros((16, dim), dtype=np.float32)  # Có dư sức chứa để thêm không phải copy lại
+        self._row_ids = np.zeros(0, dtype=np.int32)            # Dòng -> chỉ số người (các dòng của 1 người nằm liền nhau)
+        self._n = 0
+        self._groups = None       # Cache (vị trí bắt đầu mỗi nhóm dòng, chỉ số người của nhóm)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def gallery(self):
+        return self._gallery[:self._n]
+
+    def templates(self, name):
+        with self._lock:
+            if name not in self._index: return np.zeros((0, self.dim), dtype=np.float32)
+            return np.array(self._gallery[:self._n][self._row_ids == self._index[name]])
+
+    def load(self, face_db):
+        """Nạp lại toàn bộ từ dict {tên: đặc trưng hoặc ma trận nhiều mẫu} (giữ nguyên thứ tự của dict)"""
+        row_names, rows = [], []
+        for name, feats in face_db.items():
+            feats = l2_normalize(np.reshape(feats, (-1, self.dim)))
+            row_names += [name] * len(feats)
+            rows.append(feats)
+        self.load_matrix(row_names, np.vstack(rows) if rows else None)
+
+    def load_matrix(self, row_names, matrix):
+        """Dùng thẳng ma trận đã chuẩn hóa L2 (vd: np.memmap từ FaceStore), không copy
+        row_names: tên ứng với từng dòng, 1 người có thể chiếm nhiều dòng
+        """
+        names = list(dict.fromkeys(row_names))
+        index = {name: i for i, name in enumerate(names)}
+        row_ids = np.array([index[n] for n in row_names], dtype=np.int32)
+        if len(row_ids) and not self._is_grouped(row_ids):
+            # Các dòng của 1 người không liền nhau -> sắp lại (phải copy vào RAM)
+            order = np.argsort(row_ids, kind="stable")
+            matrix, row_ids = np.asarray(matrix)[order], row_ids[order]
+        with self._lock:
+            self.names, self._index, self._row_ids = names, index, row_ids
+            self._n = len(row_ids)
+            self._gallery = matrix if self._n else np.zeros((16, self.dim), dtype=np.float32)
+            self._groups = None
+
+    @staticmethod
+    def _is_grouped(row_ids):
+        starts = np.r_[True, row_ids[1:] != row_ids[:-1]]
+        return len(np.unique(row_ids)) == int(starts.sum())
+
+    def _reserve(self, extra):
+        """Đảm bảo gallery là mảng RAM ghi được, còn đủ chỗ cho thêm `extra` dòng"""
+        if isinstance(self._gallery, np.memmap) or not self._gallery.flags.writeable or self._n + extra > len(self._gallery):
+            grown = np.zeros((max(16, (self._n + extra) * 2), self.dim), dtype=np.float32)
+            grown[:self._n] = self._gallery[:self._n]
+            self._gallery = grown
+
+    def _drop_rows(self, person):
+        keep = self._row_ids != person
+        n_keep = int(keep.sum())
+        if n_keep != self._n:
+            self._gallery[:n_keep] = self._gallery[:self._n][keep]
+            self._row_ids = self._row_ids[keep]
+            self._n = n_keep
+
+    # ============= THÊM / XÓA TỪNG NGƯỜI =============
+    def add(self, name, features):
+        """Thêm người mới hoặc thay toàn bộ mẫu của người đã có (giữ vị trí cũ như dict)"""
+        rows = l2_normalize(np.reshape(features, (-1, self.dim)))
+        with self._lock:
+            self._reserve(len(rows))
+            if name in self._index:
+                person = self._index[name]
+                self._drop_rows(person)
+            else:
+                person = len(self.names)
+                self._index[name] = person
+                self.names.append(name)
+            self._gallery[self._n:self._n + len(rows)] = rows
+            self._row_ids = np.r_[self._row_ids, np.full(len(rows), person, dtype=np.int32)]
+            self._n += len(rows)
+            self._groups = None
+
+    def remove(self, name):
+        with self._lock:
+            if name not in self._index: return False
+            self._reserve(0)
+            person = self._index.pop(name)
+            self._drop_rows(person)
+            del self.names[person]
+            self._row_ids = np.where(self._row_ids > person, self._row_ids - 1, self._row_ids).astype(np.int32)
+            for j in range(person, len(self.names)): self._index[self.names[j]] = j
+            self._groups = None
+            return True
+
+    # ============= SO KHỚP =============
+    def _group_starts(self):
+        if self._groups is None:
+            starts = np.flatnonzero(np.r_[True, self._row_ids[1:] != self._row_ids[:-1]])
+            self._groups = (starts, self._row_ids[starts])
+        return self._groups
+
+    def scores(self, features):
+        """Ma trận cosine (số probe x số người), mỗi người lấy điểm cao nhất trong các mẫu"""
+        sims = l2_normalize(features) @ self.gallery.T
+        starts, persons = self._group_starts()
+        per_person = np.empty((len(sims), len(self.names)), dtype=np.float32)
+        per_person[:, persons] = np.maximum.reduceat(sims, starts, axis=1)
+        return per_person
+
+    def match(self, feature):
+        return self.match_batch(feature)[0]
+
+    def match_batch(self, features):
+        """Trả về [(tên hoặc "Unknown", điểm cao nhất)] cho từng probe
+        Giống logic cũ: lấy điểm cao nhất (tối thiểu 0.0), chỉ nhận tên khi vượt threshold
+        """
+        features = np.asarray(features, dtype=np.float32)
+        n_probe = 1 if features.ndim == 1 else len(features)
+        with self._lock:
+            if self._n == 0: return [("Unknown", 0.0)] * n_probe
+            sims = self.scores(features)
+            names = list(self.names)
+        best = np.argmax(sims, axis=1)
+        best_scores = sims[np.arange(len(sims)), best]
+        results = []
+        for idx, score in zip(best, best_scores):
+            score = float(score)
+            name = names[idx] if score > self.threshold else "Unknown"
+            results.append((name, max(score, 0.0)))
+        return results
+
+    def assign(self, features, exclude=()):
+        """Như match_batch nhưng gán 1-1: mỗi người chỉ thuộc về tối đa 1 probe trong cùng frame
+        Ghép tham lam theo điểm giảm dần; exclude = tên đã thuộc về mặt khác trong frame
+        Probe không giành được ai: ("Unknown", điểm cao nhất với những người còn lại)
+        """
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            if self._n == 0: return [("Unknown", 0.0)] * len(features)
+            sims = self.scores(features)
+            names = list(self.names)
+        taken = np.zeros(len(names), dtype=bool)
+        taken[[i for i, name in enumerate(names) if name in exclude]] = True
+        results = [None] * len(sims)
+        for probe, person in zip(*np.unravel_index(np.argsort(-sims, axis=None), sims.shape)):
+            score = float(sims[probe, person])
+            if score <= self.threshold: break
+            if results[probe] is not None or taken[person]: continue
+            results[probe] = (names[person], score)
+            taken[person] = True
+        for probe, result in enumerate(results):
+            if result is not None: continue
+            free = sims[probe][~taken]
+            results[probe] = ("Unknown", max(float(free.max()), 0.0) if len(free) else 0.0)
+        return results
+
+    def top_k(self, feature, k=5):
+        """k người giống nhất cho 1 probe, sắp xếp giảm dần: [(tên, điểm)]"""
+        with self._lock:
+            if self._n == 0: return []
+            sims = self.scores(feature)[0]
+            names = list(self.names)
+        k = min(k, len(names))
+        idx = np.argpartition(-sims, k - 1)[:k]
+        idx = idx[np.argsort(-sims[idx], kind="stable")]
+        return [(names[i], float(sims[i])) for i in idx]
@@ -0,0 +1,163 @@
+"""
+Module lưu trữ cơ sở dữ liệu khuôn mặt dạng nhị phân (thay cho face_db.json)
+
+Cấu trúc file (little-endian):
+    [Header 64 byte] magic, version, dim, count, capacity, name_size
+    [Bảng tên]       capacity ô, mỗi ô name_size byte (UTF-8, đệm \\0)
+    [Ma trận]        capacity x dim float32 (đặc trưng đã chuẩn hóa L2) -> np.memmap trực tiếp
+
+File được cấp dư sức chứa (capacity). Thêm người mới chỉ ghi vào các ô trống rồi mới
+cập nhật "count" trong header, nên dữ liệu dở dang không bao giờ được đọc thấy.
+Khi hết chỗ hoặc khi xóa thì ghi file tạm rồi os.replace (nguyên tử).
+Mọi thao tác ghi giữ khóa riêng của FaceStore (nhiều luồng Flask có thể đăng ký / xóa cùng lúc).
+
+Chuyển đổi 1 lần từ file cũ:  python face_store.py face_db.json face_db.bin
+"""
+import json
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from face_matcher import l2_normalize
+
+MAGIC = b"SHFACEDB"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIII36x")  # 64 byte
+NAME_SIZE = 64
+MIN_CAPACITY = 64
+
+
+class FaceStore:
+    def __init__(self, path, dim=128):
+        self.path = path
+        self.dim = dim
+        self.names = []     # Tên của từng dòng trong ma trận (1 người có thể có nhiều dòng)
+        self.capacity = 0
+        self._lock = threading.RLock()  # Ghi tuần tự: names + header luôn khớp với file
+        if os.path.exists(path): self._read_header()
+
+    def __len__(self):
+        return len(self.names)
+
+    # ============= ĐỌC =============
+    def _offsets(self, capacity):
+        names_off = HEADER.size
+        return names_off, names_off + capacity * NAME_SIZE
+
+    def _read_header(self):
+        with open(self.path, 'rb') as f:
+            magic, version, dim, count, capacity, name_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or name_size != NAME_SIZE:
+                raise ValueError(f"File {self.path} không đúng định dạng face DB")
+            raw = f.read(count * NAME_SIZE)
+        self.dim, self.capacity = dim, capacity
+        self.names = [raw[i:i + NAME_SIZE].rstrip(b"\0").decode("utf-8") for i in range(0, len(raw), NAME_SIZE)]
+
+    def matrix(self):
+        """Ma trận (count x dim) ánh xạ thẳng từ file, chỉ đọc - không parse, không copy"""
+        if not self.names: return np.zeros((0, self.dim), dtype=np.float32)
+        _, mat_off = self._offsets(self.capacity)
+        return np.memmap(self.path, dtype=np.float32, mode='r', offset=mat_off, shape=(len(self.names), self.dim))
+
+    def templates(self, name):
+        with self._lock:
+            rows = [i for i, n in enumerate(self.names) if n == name]
+            return np.array(self.matrix()[rows]) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+    @staticmethod
+    def is_valid_name(name):
+        return bool(name) and len(name.encode("utf-8")) <= NAME_SIZE and "\0" not in name
+
+    # ============= GHI =============
+    def _encode_names(self, names):
+        for name in names:
+            if not self.is_valid_name(name): raise ValueError(f"Tên không hợp lệ: {name!r}")
+        return b"".join(name.encode("utf-8").ljust(NAME_SIZE, b"\0") for name in names)
+
+    def append(self, name, vectors):
+        """Thêm 1 hoặc nhiều vector cho 1 người, chỉ ghi phần mới vào cuối"""
+        rows = l2_normalize(vectors)
+        names = [name] * len(rows)
+        with self._lock:
+            count = len(self.names)
+            if count + len(rows) > self.capacity:
+                self._rewrite(self.names + names, np.vstack([self.matrix(), rows]))
+                return
+
+            names_off, mat_off = self._offsets(self.capacity)
+            with open(self.path, 'r+b') as f:
+                f.seek(names_off + count * NAME_SIZE)
+                f.write(self._encode_names(names))
+                f.seek(mat_off + count * self.dim * 4)
+                f.write(rows.astype("<f4").tobytes())
+                f.flush(); os.fsync(f.fileno())
+                # Điểm commit: chỉ khi header có count mới thì các dòng trên mới "tồn tại"
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, VERSION, self.dim, count + len(rows), self.capacity, NAME_SIZE))
+                f.flush(); os.fsync(f.fileno())
+            self.names.extend(names)
+
+    def replace(self, name, vectors):
+        """Thay toàn bộ vector của 1 người (ghi lại cả file một cách nguyên tử)"""
+        rows = l2_normalize(vectors)
+        with self._lock:
+            keep = [i for i, n in enumerate(self.names) if n != name]
+            self._rewrite([self.names[i] for i in keep] + [name] * len(rows), np.vstack([self.matrix()[keep], rows]))
+
+    def put_many(self, people):
+        """Ghi nhiều người trong 1 lần ghi file nguyên tử ({tên: ma trận mẫu}, người đã có thì thay mẫu cũ)
+        Ma trận rỗng (0 dòng) = xóa người đó"""
+        with self._lock:
+            keep = [i for i, n in enumerate(self.names) if n not in people]
+            names, rows = [self.names[i] for i in keep], [np.asarray(self.matrix())[keep]]
+            for name, vectors in people.items():
+                vectors = l2_normalize(np.reshape(vectors, (-1, self.dim)))
+                names += [name] * len(vectors)
+                rows.append(vectors)
+            self._rewrite(names, np.vstack(rows))
+
+    def remove(self, name):
+        with self._lock:
+            keep = [i for i, n in enumerate(self.names) if n != name]
+            if len(keep) == len(self.names): return False
+            self._rewrite([self.names[i] for i in keep], np.asarray(self.matrix())[keep])
+            return True
+
+    def _rewrite(self, names, matrix):
+        with self._lock:
+            capacity = max(MIN_CAPACITY, self.capacity, 1)
+            while capacity < len(names): capacity *= 2
+            names_off, mat_off = self._offsets(capacity)
+            matrix = np.ascontiguousarray(matrix, dtype="<f4").reshape(len(names), self.dim)
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, self.dim, len(names), capacity, NAME_SIZE))
+                f.write(self._encode_names(names).ljust(capacity * NAME_SIZE, b"\0"))
+                f.write(matrix.tobytes())
+                f.truncate(mat_off + capacity * self.dim * 4)
+                f.flush(); os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.names, self.capacity = list(names), capacity
+
+
+def import_json_db(json_path, store):
+    """Chuyển đổi 1 lần từ face_db.json cũ ({tên: [128 số]}) sang FaceStore"""
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    names = list(data.keys())
+    if not names: return 0
+    matrix = l2_normalize(np.stack([np.ravel(np.array(v, dtype=np.float32)) for v in data.values()]))
+    store.dim = matrix.shape[1]
+    store._rewrite(names, matrix)
+    return len(names)
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else "face_db.json"
+    dst = sys.argv[2] if len(sys.argv) > 2 else "face_db.bin"
+    n = import_json_db(src, FaceStore(dst))
+    print(f">>> Đã chuyển {n} người từ {src} sang {dst}")
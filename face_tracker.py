@@ -0,0 +1,102 @@
+"""
+Module theo dõi khuôn mặt qua nhiều frame (tracking)
+Ghép các box YuNet giữa các frame theo IoU, lưu lại danh tính + điểm của từng track
+để chỉ chạy SFace khi thật sự cần (track mới, đến hạn kiểm tra lại, hoặc độ tin cậy giảm).
+"""
+import itertools
+
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU giữa 2 tập box (x, y, w, h), trả về ma trận len(a) x len(b)"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.clip(np.minimum(ax2[:, None], bx2[None]) - np.maximum(a[:, 0, None], b[None, :, 0]), 0, None)
+    ih = np.clip(np.minimum(ay2[:, None], by2[None]) - np.maximum(a[:, 1, None], b[None, :, 1]), 0, None)
+    inter = iw * ih
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.name = None          # None = chưa nhận diện lần nào
+        self.score = 0.0
+        self.confidence = 0.0     # Điểm lúc nhận diện, giảm dần theo thời gian và chuyển động
+        self.frames_since_verify = 0
+        self.misses = 0
+
+
+class FaceTracker:
+    def __init__(self, threshold=0.30, iou_threshold=0.3, reverify_interval=15,
+                 unknown_retry_interval=5, confidence_margin=0.05, decay=0.99, max_misses=5):
+        self.threshold = threshold                  # Ngưỡng cosine nhận người quen
+        self.iou_threshold = iou_threshold          # IoU tối thiểu để coi là cùng 1 mặt
+        self.reverify_interval = reverify_interval  # Số frame tối đa dùng lại danh tính đã biết
+        self.unknown_retry_interval = unknown_retry_interval  # Với mặt lạ: thử lại sau bấy nhiêu frame
+        self.confidence_margin = confidence_margin  # Độ tin cậy < threshold + margin -> nhận diện lại
+        self.decay = decay                          # Hệ số giảm độ tin cậy mỗi frame
+        self.max_misses = max_misses                # Mất dấu quá số frame này thì xóa track
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.recognitions_run = 0
+        self.recognitions_avoided = 0
+
+    def update(self, boxes):
+        """Ghép box mới với các track hiện có. Trả về danh sách track theo đúng thứ tự boxes"""
+        boxes = [tuple(map(float, b[:4])) for b in boxes]
+        assigned = [None] * len(boxes)
+
+        if boxes and self.tracks:
+            ious = iou_matrix([t.box for t in self.tracks], boxes)
+            # Ghép tham lam theo IoU giảm dần
+            for ti, bi in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+                if ious[ti, bi] < self.iou_threshold: break
+                track = self.tracks[ti]
+                if assigned[bi] is not None or track.misses < 0: continue
+                # Mặt di chuyển nhiều -> giảm độ tin cậy nhiều hơn
+                track.confidence *= self.decay * (0.5 + 0.5 * float(ious[ti, bi]))
+                track.box = boxes[bi]
+                track.misses = -1  # Đánh dấu đã ghép trong frame này
+                assigned[bi] = track
+
+        for track in self.tracks:
+            if track.misses < 0: track.misses = 0
+            else: track.misses += 1
+            track.frames_since_verify += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for bi, box in enumerate(boxes):
+            if assigned[bi] is None:
+                assigned[bi] = Track(next(self._ids), box)
+                self.tracks.append(assigned[bi])
+        return assigned
+
+    def needs_recognition(self, track):
+        if track.name is None: return True
+        if track.name == "Unknown": return track.frames_since_verify >= self.unknown_retry_interval
+        if track.frames_since_verify >= self.reverify_interval: return True
+        return track.confidence < self.threshold + self.confidence_margin
+
+    def set_identity(self, track, name, score):
+        track.name, track.score, track.confidence = name, score, score
+        track.frames_since_verify = 0
+        self.recognitions_run += 1
+
+    def forget(self, name):
+        """Buộc nhận diện lại các track đang mang tên này (khi người dùng bị xóa / đăng ký lại)"""
+        for track in self.tracks:
+            if track.name == name: track.name = None
+
+    def mark_reused(self):
+        self.recognitions_avoided += 1
+
+    def stats(self):
+        return {"tracks": len(self.tracks), "recognitions_run": self.recognitions_run,
+                "recognitions_avoided": self.recognitions_avoided}
@@ -0,0 +1,131 @@
+"""
+Module nguồn video + danh sách camera (cameras.json)
+- Nguồn có thể là chỉ số webcam (0, 1...), URL RTSP/HTTP, file video
+  hoặc camera giả "synthetic" / "synthetic:640x480@15" (sinh frame có vật chuyển động, dùng khi test tải)
+- Luồng mạng bị rớt thì tự mở lại; file video tự phát lại từ đầu, phát đúng tốc độ FPS của file
+- Dùng thay cho cv2.VideoCapture trong FramePipeline (cùng hàm read() / release())
+- Chỉ mở nguồn ở lần read() đầu tiên (trong luồng capture): webcam thiếu / treo không chặn web khởi động
+
+Ví dụ cameras.json:
+{
+    "workers": 2,
+    "cameras": [
+        {"id": "living", "name": "Phòng Khách", "source": 0, "room": "living"},
+        {"id": "bedroom", "name": "Phòng Ngủ", "source": "rtsp://192.168.1.20:554/stream1", "room": "bedroom"}
+    ]
+}
+"workers" = số tiến trình AI (0 = chạy AI ngay trong tiến trình web như trước).
+"room" (tùy chọn) = cử chỉ từ camera này chỉ điều khiển thiết bị cùng phòng (hoặc thiết bị không gán phòng).
+"motion" (tùy chọn) = tham số MotionGate, vd {"idle_after": 30, "min_area": 0.01}; false = luôn chạy AI.
+"""
+import json
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_CAMERAS = {"workers": 0, "cameras": [{"id": "cam0", "name": "Camera", "source": 0, "room": None, "motion": {}}]}
+
+
+def load_camera_config(path="cameras.json"):
+    if not os.path.exists(path): return DEFAULT_CAMERAS
+    with open(path, 'r', encoding='utf-8') as f: config = json.load(f)
+    cameras = []
+    for i, cam in enumerate(config.get("cameras", [])):
+        cam_id = str(cam.get("id", f"cam{i}"))
+        cameras.append({"id": cam_id, "name": cam.get("name", cam_id), "source": cam.get("source", 0),
+                        "room": cam.get("room"), "motion": cam.get("motion", {})})
+    if not cameras: raise ValueError(f"{path} không có camera nào")
+    if len({c["id"] for c in cameras}) != len(cameras): raise ValueError(f"{path} có id camera bị trùng")
+    return {"workers": int(config.get("workers", 0)), "cameras": cameras}
+
+
+class SyntheticCapture:
+    """Camera giả cùng giao diện cv2.VideoCapture: nền gradient + 1 hình tròn chạy vòng + số frame"""
+
+    def __init__(self, width=640, height=480, fps=15.0):
+        self.width, self.height, self.fps = width, height, fps
+        self.index = 0
+        ramp = np.linspace(40, 200, width, dtype=np.uint8)
+        self._background = np.dstack([np.tile(ramp, (height, 1))] * 3)
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Chuỗi nguồn dạng synthetic hoặc synthetic:640x480@15 (rộng x cao @ fps)"""
+        _, _, rest = spec.partition(":")
+        if not rest: return cls()
+        size, _, fps = rest.partition("@")
+        width, height = (int(v) for v in size.split("x"))
+        return cls(width, height, float(fps or 15.0))
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return self.fps if prop == cv2.CAP_PROP_FPS else 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES: self.index = int(value)
+        return True
+
+    def read(self):
+        frame = self._background.copy()
+        t = self.index / self.fps
+        center = (int(self.width * (0.5 + 0.35 * math.cos(t))), int(self.height * (0.5 + 0.35 * math.sin(t))))
+        cv2.circle(frame, center, max(8, self.height // 10), (0, 160, 255), -1)
+        cv2.putText(frame, f"#{self.index}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        self.index += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class FrameSource:
+    def __init__(self, source, reconnect_delay=2.0, loop=True):
+        # "0" trong JSON/biến môi trường cũng hiểu là webcam số 0
+        self.source = int(source) if isinstance(source, str) and source.isdigit() else source
+        self.is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        self.is_synthetic = isinstance(self.source, str) and self.source.startswith("synthetic")
+        self.reconnect_delay = reconnect_delay
+        self.loop = loop
+        self.reconnects = 0
+        self._next_open = 0.0
+        self.cap = None
+
+    def _open(self):
+        self.cap = SyntheticCapture.from_spec(self.source) if self.is_synthetic else cv2.VideoCapture(self.source)
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.is_file or self.is_synthetic else 0
+        self.frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self._next_frame = time.monotonic()
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        if self.cap is None:
+            self._next_open = time.monotonic() + self.reconnect_delay
+            self._open()
+        if self.frame_interval:
+            # File video / camera giả: giữ nhịp như camera thật thay vì đọc nhanh hết mức
+            delay = self._next_frame - time.monotonic()
+            if delay > 0: time.sleep(delay)
+            self._next_frame = max(self._next_frame + self.frame_interval, time.monotonic() - self.frame_interval)
+        ok, frame = self.cap.read()
+        if ok: return ok, frame
+
+        if self.is_file and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return self.cap.read()
+        if not self.is_file and time.monotonic() >= self._next_open:
+            # Camera / luồng RTSP bị rớt: mở lại, không thử liên tục
+            self._next_open = time.monotonic() + self.reconnect_delay
+            self.cap.release()
+            self._open()
+            self.reconnects += 1
+        return False, None
+
+    def release(self):
+        if self.cap is not None: self.cap.release()
@@ -0,0 +1,101 @@
+"""
+Module phân loại cử chỉ tay dạng bảng (table-driven), tính toán vector hóa bằng NumPy
+- 21 landmark của mỗi bàn tay được đổi 1 lần sang mảng (số tay x 21 x 3)
+- Cờ duỗi ngón, khoảng cách giữa các đầu ngón, kiểm tra ngón cái theo tay trái/phải
+  được tính cho tất cả bàn tay cùng lúc
+- Cử chỉ được so với bảng mẫu (có thể nạp từ gestures.json), mẫu nào khớp trước thì thắng
+Thêm cử chỉ mới = thêm 1 dòng vào bảng, không phải thêm nhánh if/elif.
+"""
+import json
+import operator
+import os
+
+import numpy as np
+
+# Đầu ngón: Cái(4), Trỏ(8), Giữa(12), Áp út(16), Út(20)
+TIPS = np.array([4, 8, 12, 16, 20])
+
+# Ngón cái duỗi khi sign * (x[3] - x[4]) > 0. Luật cũ x[4] < x[3] (viết cho tay phải, ảnh kiểu gương)
+# ứng với nhãn "Right" của MediaPipe (MediaPipe cũng gán nhãn theo giả định ảnh đã lật gương).
+THUMB_SIGN = {"Right": 1.0, "Left": -1.0}
+
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+# fingers = [Cái, Trỏ, Giữa, Áp Út, Út], null = không quan tâm
+DEFAULT_PATTERNS = [
+    {"name": "OPEN_HAND", "fingers": [1, 1, 1, 1, 1]},
+    {"name": "THUMB_DOWN", "fingers": [0, 0, 0, 0, 0], "when": [["thumb_drop", ">", 0.05]]},
+    {"name": "FIST", "fingers": [0, 0, 0, 0, 0]},
+    {"name": "POINTING", "fingers": [0, 1, 0, 0, 0]},
+    {"name": "THUMB_UP", "fingers": [1, 0, 0, 0, 0], "when": [["thumb_drop", "<", 0.0]]},
+    {"name": "VICTORY", "fingers": [0, 1, 1, 0, 0]},
+    {"name": "ROCK", "fingers": [0, 1, 0, 0, 1]},
+    {"name": "THREE", "fingers": [0, 1, 1, 1, 0]},
+    {"name": "LOVE", "fingers": [1, 1, 0, 0, 1]},
+    {"name": "OK_SIGN", "fingers": [0, 0, 1, 1, 1], "when": [["thumb_index_dx", "<", 0.05]]},
+]
+
+
+def hands_to_array(results):
+    """Kết quả MediaPipe -> (mảng số tay x 21 x 3, danh sách nhãn tay "Left"/"Right")"""
+    if not results.multi_hand_landmarks: return np.zeros((0, 21, 3), dtype=np.float32), []
+    points = np.array([[(lm.x, lm.y, lm.z) for lm in hand.landmark] for hand in results.multi_hand_landmarks],
+                      dtype=np.float32)
+    labels = [h.classification[0].label for h in (results.multi_handedness or [])]
+    return points, labels + [None] * (len(points) - len(labels))
+
+
+def hand_features(points, labels):
+    """Tính cờ duỗi ngón (số tay x 5) và các đặc trưng số dùng cho điều kiện phụ"""
+    x, y = points[:, :, 0], points[:, :, 1]
+    sign = np.array([THUMB_SIGN.get(label, 1.0) for label in labels], dtype=np.float32)
+
+    fingers = np.empty((len(points), 5), dtype=np.int8)
+    fingers[:, 0] = sign * (x[:, 3] - x[:, 4]) > 0            # Ngón cái: so ngang, theo tay trái/phải
+    fingers[:, 1:] = y[:, TIPS[1:]] < y[:, TIPS[1:] - 2]      # 4 ngón dài: đầu ngón cao hơn khớp
+
+    tips = points[:, TIPS, :2]
+    tip_dist = np.linalg.norm(tips[:, :, None] - tips[:, None], axis=-1)  # Khoảng cách giữa các đầu ngón
+    palm = np.maximum(np.linalg.norm(points[:, 9, :2] - points[:, 0, :2], axis=-1), 1e-6)
+    features = {
+        "thumb_drop": y[:, 4] - y[:, 3],                # > 0: đầu ngón cái thấp hơn khớp
+        "thumb_index_dx": np.abs(x[:, 4] - x[:, 8]),
+        "thumb_index_dist": tip_dist[:, 0, 1],
+        "thumb_index_dist_norm": tip_dist[:, 0, 1] / palm,
+        "index_middle_dist_norm": tip_dist[:, 1, 2] / palm,
+    }
+    return fingers, features
+
+
+class GestureClassifier:
+    def __init__(self, patterns=None):
+        self.load(patterns or DEFAULT_PATTERNS)
+
+    @classmethod
+    def from_json(cls, path):
+        if not os.path.exists(path): return cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f: return cls(json.load(f))
+        except Exception as e:
+            print(f"Lỗi đọc {path}: {e}, dùng bảng cử chỉ mặc định")
+            return cls()
+
+    def load(self, patterns):
+        self.names = [p["name"] for p in patterns]
+        fingers = [[-1 if v is None else int(v) for v in p["fingers"]] for p in patterns]
+        self.finger_table = np.array(fingers, dtype=np.int8).reshape(-1, 5)
+        self.care = self.finger_table >= 0
+        # Điều kiện phụ: (chỉ số mẫu, tên đặc trưng, phép so sánh, giá trị)
+        self.conditions = [(i, feat, OPS[op], float(value))
+                           for i, p in enumerate(patterns) for feat, op, value in p.get("when", [])]
+
+    def classify(self, points, labels):
+        """Phân loại tất cả bàn tay trong 1 lượt, trả về danh sách tên cử chỉ ("None" nếu không khớp)"""
+        if not len(points): return []
+        fingers, features = hand_features(points, labels)
+        # (số tay x số mẫu): mẫu khớp khi mọi ngón được quan tâm đều đúng trạng thái
+        ok = np.all((fingers[:, None, :] == self.finger_table[None]) | ~self.care[None], axis=2)
+        for i, feat, op, value in self.conditions:
+            ok[:, i] &= op(features[feat], value)
+        first = np.argmax(ok, axis=1)
+        return [self.names[g] if ok[h, g] else "None" for h, g in enumerate(first)]
@@ -0,0 +1,76 @@
+"""
+Module chống rung cử chỉ (debounce) theo thời gian
+Nhãn cử chỉ từng frame được bỏ phiếu trong cửa sổ trượt, phải giữ đủ lâu mới được công nhận,
+mỗi cử chỉ có thời gian chờ (cooldown) riêng. Kết quả là luồng sự kiện "started"/"ended":
+lệnh điều khiển thiết bị chỉ chạy 1 lần cho mỗi lần ra cử chỉ có chủ đích.
+"""
+import time
+from collections import Counter, deque
+
+
+class GestureEvent:
+    def __init__(self, kind, gesture, user, timestamp):
+        self.kind = kind            # "started" hoặc "ended"
+        self.gesture = gesture
+        self.user = user
+        self.timestamp = timestamp
+
+    def to_dict(self):
+        return {"kind": self.kind, "gesture": self.gesture, "user": self.user, "timestamp": self.timestamp}
+
+    def __repr__(self):
+        return f"GestureEvent({self.kind}, {self.gesture}, {self.user})"
+
+
+class GestureDebouncer:
+    def __init__(self, window=7, min_votes=0.6, min_hold=0.3, cooldown=1.5, cooldowns=None, clock=time.monotonic):
+        self.votes = deque(maxlen=window)  # Nhãn của các frame gần nhất
+        self.min_votes = min_votes         # Tỉ lệ phiếu tối thiểu để 1 nhãn thắng
+        self.min_hold = min_hold           # Nhãn thắng phải giữ liên tục bấy nhiêu giây
+        self.cooldown = cooldown           # Thời gian chờ mặc định giữa 2 lần kích hoạt cùng cử chỉ
+        self.cooldowns = cooldowns or {}   # Cooldown riêng từng cử chỉ, vd {"FIST": 3.0}
+        self.clock = clock
+
+        self.active = "None"               # Cử chỉ đang được giữ (đã công nhận)
+        self.active_user = "Unknown"
+        self.active_fired = False          # Cử chỉ đang giữ đã phát "started" chưa (hay bị cooldown chặn)
+        self.candidate = "None"
+        self.candidate_since = 0.0
+        self.last_fired = {}               # Cử chỉ -> thời điểm phát "started" gần nhất
+        self.last_user = "Unknown"
+        self.events = deque(maxlen=100)    # Lịch sử sự kiện gần đây
+        self.suppressed = 0                # Số lần bị chặn bởi cooldown
+
+    def _vote(self):
+        label, count = Counter(self.votes).most_common(1)[0]
+        return label if count >= self.min_votes * self.votes.maxlen else "None"
+
+    def update(self, user, gesture, now=None):
+        """Đưa vào kết quả 1 frame, trả về danh sách sự kiện mới phát sinh"""
+        now = self.clock() if now is None else now
+        if user != "Unknown": self.last_user = user
+        self.votes.append(gesture if user != "Unknown" else "None")
+        voted = self._vote()
+
+        if voted == self.active:
+            self.candidate = voted
+            return []
+        if voted != self.candidate:
+            self.candidate, self.candidate_since = voted, now
+            if self.min_hold > 0: return []
+        if now - self.candidate_since < self.min_hold: return []
+
+        new_events = []
+        if self.active_fired:
+            new_events.append(GestureEvent("ended", self.active, self.active_user, now))
+        self.active, self.active_user, self.active_fired = voted, self.last_user, False
+        if voted != "None":
+            cooldown = self.cooldowns.get(voted, self.cooldown)
+            if now - self.last_fired.get(voted, -cooldown) >= cooldown:
+                self.last_fired[voted] = now
+                self.active_fired = True
+                new_events.append(GestureEvent("started", voted, self.active_user, now))
+            else:
+                self.suppressed += 1
+        self.events.extend(new_events)
+        return new_events
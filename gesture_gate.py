@@ -0,0 +1,63 @@
+"""
+Module quyết định khi nào / ở đâu chạy MediaPipe Hands
+- Không có người quen trong khung hình -> bỏ qua hoàn toàn (kết quả cử chỉ không được dùng)
+- Có bàn tay ở frame trước -> chỉ tìm quanh bàn tay đó
+- Chưa thấy tay -> tìm trong vùng quanh mặt người quen,
+  cứ fallback_interval lần không thấy thì tìm toàn khung hình 1 lần
+"""
+
+
+class GestureGate:
+    def __init__(self, fallback_interval=5, hand_expand=0.6, face_region=(2.5, 1.0, 2.5, 4.0)):
+        self.fallback_interval = fallback_interval  # Số lần tìm ROI hụt trước khi tìm toàn khung
+        self.hand_expand = hand_expand              # Mở rộng box bàn tay mỗi phía (x kích thước tay)
+        self.face_region = face_region              # Vùng quanh mặt: (trái, trên, phải, dưới) x kích thước mặt
+        self.last_hand_box = None
+        self.misses = 0
+        self.skipped = 0
+        self.roi_runs = 0
+        self.full_runs = 0
+
+    @staticmethod
+    def _clip(x0, y0, x1, y1, w, h):
+        x0, y0, x1, y1 = max(0, int(x0)), max(0, int(y0)), min(w, int(x1)), min(h, int(y1))
+        if x1 - x0 < 32 or y1 - y0 < 32: return None
+        return x0, y0, x1, y1
+
+    def select_region(self, frame_shape, known_boxes):
+        """Trả về vùng (x0, y0, x1, y1) cần chạy MediaPipe, hoặc None nếu bỏ qua frame này"""
+        h, w = frame_shape[:2]
+        if not known_boxes:
+            self.last_hand_box = None
+            self.skipped += 1
+            return None
+
+        if self.last_hand_box is not None:
+            x, y, bw, bh = self.last_hand_box
+            region = self._clip(x - bw * self.hand_expand, y - bh * self.hand_expand,
+                                x + bw * (1 + self.hand_expand), y + bh * (1 + self.hand_expand), w, h)
+            if region:
+                self.roi_runs += 1
+                return region
+
+        if self.misses >= self.fallback_interval:
+            self.misses = 0
+            self.full_runs += 1
+            return 0, 0, w, h
+
+        # Gộp vùng quanh tất cả mặt người quen thành 1 hình chữ nhật
+        left, top, right, bottom = self.face_region
+        x0 = min(x - fw * left for x, y, fw, fh in known_boxes)
+        y0 = min(y - fh * top for x, y, fw, fh in known_boxes)
+        x1 = max(x + fw * (1 + right) for x, y, fw, fh in known_boxes)
+        y1 = max(y + fh * (1 + bottom) for x, y, fw, fh in known_boxes)
+        self.roi_runs += 1
+        return self._clip(x0, y0, x1, y1, w, h) or (0, 0, w, h)
+
+    def report(self, hand_box):
+        """Cập nhật kết quả lần chạy vừa rồi: box bàn tay (pixel) hoặc None nếu không thấy"""
+        self.last_hand_box = hand_box
+        self.misses = 0 if hand_box is not None else self.misses + 1
+
+    def stats(self):
+        return {"skipped": self.skipped, "roi_runs": self.roi_runs, "full_runs": self.full_runs}
@@ -0,0 +1,139 @@
+"""
+Module ghi lịch sử điều khiển (history_log.csv) bất đồng bộ
+- save_history chỉ đẩy dòng log vào hàng đợi trong RAM, không chạm ổ đĩa
+- 1 luồng nền gom các dòng và ghi theo lô (khi đủ số dòng hoặc hết thời gian chờ)
+- fsync theo chính sách: mỗi lô / mỗi N giây / không bao giờ
+- Xoay vòng file theo dung lượng hoặc theo ngày, file cũ được nén .gz
+- Ghi nốt phần còn lại khi tắt chương trình
+"""
+import atexit
+import csv
+import datetime
+import glob
+import gzip
+import io
+import os
+import shutil
+import threading
+import time
+
+from metrics import stage
+
+
+class HistoryLogger:
+    def __init__(self, path="history_log.csv", header=None, batch_size=50, flush_interval=1.0,
+                 fsync_interval=5.0, max_bytes=5 * 1024 * 1024, rotate_daily=False, backups=20,
+                 on_flush=None, on_rotate=None, timer=None):
+        self.path = path
+        self.header = header
+        self.batch_size = batch_size          # Đủ bấy nhiêu dòng thì ghi ngay
+        self.flush_interval = flush_interval  # Dòng chờ lâu nhất (giây) trước khi được ghi
+        self.fsync_interval = fsync_interval  # 0 = fsync mỗi lô, None = không fsync (để hệ điều hành tự ghi)
+        self.max_bytes = max_bytes            # Xoay vòng khi file vượt dung lượng (None = không giới hạn)
+        self.rotate_daily = rotate_daily      # Xoay vòng khi sang ngày mới
+        self.backups = backups                # Số file .gz cũ giữ lại
+        self.on_flush = on_flush              # Callback sau mỗi lô (vd: cập nhật thống kê)
+        self.on_rotate = on_rotate            # Callback sau khi đổi file (vd: đặt lại vị trí đọc)
+        self.timer = timer
+
+        self.rows_written = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._last_fsync = time.monotonic()
+        self._day = self._file_day()
+        self._running = True
+        self._thread = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ============= API =============
+    def log(self, row):
+        """Đưa 1 dòng vào hàng đợi, trả về ngay"""
+        with self._cond:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size: self._cond.notify()
+
+    def flush(self):
+        """Ghi ngay các dòng đang chờ (chạy trên luồng gọi, dùng khi tắt hoặc trong test)"""
+        with self._cond: rows, self._pending = self._pending, []
+        if rows: self._write(rows)
+
+    def close(self):
+        if not self._running: return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        return {"pending": len(self._pending), "rows_written": self.rows_written, "batches": self.batches,
+                "rotations": self.rotations, "errors": self.errors}
+
+    # ============= LUỒNG GHI =============
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= self.batch_size or not self._running,
+                                    timeout=self.flush_interval)
+                rows, self._pending = self._pending, []
+                running = self._running
+            if rows: self._write(rows)
+            if not running: return
+
+    def _write(self, rows):
+        with stage(self.timer, "history_flush"):
+            try:
+                if self._should_rotate(): self._rotate()
+                # Dựng cả lô trong RAM rồi ghi 1 lần
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                if self.header and not os.path.isfile(self.path): writer.writerow(self.header)
+                writer.writerows(rows)
+                with open(self.path, mode="a", newline="", encoding="utf-8") as f:
+                    f.write(buf.getvalue())
+                    f.flush()
+                    now = time.monotonic()
+                    if self.fsync_interval is not None and now - self._last_fsync >= self.fsync_interval:
+                        os.fsync(f.fileno())
+                        self._last_fsync = now
+                self.rows_written += len(rows)
+                self.batches += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Lỗi ghi lịch sử: {e}")
+                return
+        if self.on_flush:
+            try: self.on_flush()
+            except Exception as e: print(f"Lỗi sau khi ghi lịch sử: {e}")
+
+    # ============= XOAY VÒNG FILE =============
+    def _file_day(self):
+        if not os.path.isfile(self.path): return datetime.date.today()
+        return datetime.date.fromtimestamp(os.path.getmtime(self.path))
+
+    def _should_rotate(self):
+        if not os.path.isfile(self.path): return False
+        if self.max_bytes and os.path.getsize(self.path) >= self.max_bytes: return True
+        return self.rotate_daily and self._day != datetime.date.today()
+
+    def _rotate(self):
+        base, ext = os.path.splitext(self.path)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        # Số thứ tự trong cùng 1 giây: 2 lần xoay vòng liền nhau không trùng tên, không ghi đè bản nén cũ
+        n = 0
+        while os.path.exists(f"{base}-{stamp}-{n:02d}{ext}") or os.path.exists(f"{base}-{stamp}-{n:02d}{ext}.gz"): n += 1
+        segment = f"{base}-{stamp}-{n:02d}{ext}"
+        os.replace(self.path, segment)
+        self._day = datetime.date.today()
+        self.rotations += 1
+        if self.on_rotate: self.on_rotate()
+        # Nén file cũ rồi xóa bản gốc
+        with open(segment, "rb") as src, gzip.open(segment + ".gz", "xb") as dst: shutil.copyfileobj(src, dst)
+        os.remove(segment)
+        for old in sorted(glob.glob(f"{glob.escape(base)}-*{ext}.gz"))[:-self.backups or None]:
+            os.remove(old)
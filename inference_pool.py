@@ -0,0 +1,208 @@
+"""
+Module chạy AI trong nhiều tiến trình con (nhiều camera, 1 server)
+- Mỗi tiến trình con có SmartHomeAI riêng cho từng camera được giao (MediaPipe Hands,
+  tracker, bộ dò mặt... không dùng chung giữa các luồng / camera)
+- Mỗi camera gắn cố định với 1 tiến trình (giữ trạng thái tracking), camera được chia
+  vòng tròn cho các tiến trình; mỗi camera chỉ có tối đa 1 frame đang xử lý, hàng đợi
+  trong tiến trình là FIFO nên các camera dùng chung 1 tiến trình được phục vụ luân phiên
+- Tiến trình con được khởi động bằng "python inference_pool.py --worker ..." rồi kết nối
+  ngược về qua multiprocessing.connection (không import lại app.py như kiểu spawn)
+- Mỗi camera được nạp model (+ chạy thử) ngay khi tạo proxy, tiến trình con báo trạng thái về
+  (loading / ready / failed); pipeline chỉ gửi frame khi camera "ready" và frame trước đã xong
+- Tiến trình con chết thì được khởi động lại ở lần gửi frame kế tiếp (nạp lại model cho các camera của nó)
+"""
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+
+class _Worker:
+    def __init__(self, index, proc, conn):
+        self.index = index
+        self.proc = proc
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.pending = {}  # Mã yêu cầu -> Future
+        self.statuses = {}  # id camera -> "loading" / "ready" / "failed" (tiến trình con báo về)
+        self.alive = True
+        self.reader = threading.Thread(target=self._read_loop, name=f"ai-worker-{index}-reader", daemon=True)
+        self.reader.start()
+
+    def _read_loop(self):
+        while True:
+            try: msg = self.conn.recv()
+            except (EOFError, OSError): break
+            if msg[0] == "status":
+                _, cam_id, status, error = msg
+                self.statuses[cam_id] = status
+                if error: print(f"Lỗi nạp model AI tiến trình {self.index}, camera {cam_id}: {error}")
+                continue
+            future = self.pending.pop(msg[1], None)
+            if future is None: continue
+            if msg[0] == "result": future.set_result(msg[2:])
+            else: future.set_exception(RuntimeError(msg[2]))
+        # Tiến trình con đã chết: báo lỗi cho mọi yêu cầu đang chờ
+        self.alive = False
+        for future in list(self.pending.values()): future.set_exception(RuntimeError("Tiến trình AI đã dừng"))
+        self.pending.clear()
+
+    def send(self, msg, req_id=None):
+        future = None
+        if req_id is not None:
+            future = Future()
+            self.pending[req_id] = future
+        with self.send_lock: self.conn.send(msg)
+        return future
+
+
+class InferencePool:
+    def __init__(self, workers=2, timeout=5.0):
+        self.timeout = timeout
+        self.affinity = {}  # id camera -> chỉ số tiến trình
+        self.restarts = 0
+        self._authkey = os.urandom(16)
+        self._listener = Listener(("127.0.0.1", 0), authkey=self._authkey)
+        self._lock = threading.Lock()
+        self._req_id = 0
+        self.workers = [self._spawn(i) for i in range(workers)]
+
+    def _spawn(self, index):
+        host, port = self._listener.address
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", f"{host}:{port}",
+                                 self._authkey.hex(), str(index)])
+        return _Worker(index, proc, self._listener.accept())
+
+    def _assign(self, cam_id):
+        """Chỉ số tiến trình phụ trách camera (gọi khi đang giữ self._lock)"""
+        if cam_id not in self.affinity:
+            # Chia vòng tròn: camera mới vào tiến trình đang ít camera nhất
+            loads = [list(self.affinity.values()).count(i) for i in range(len(self.workers))]
+            self.affinity[cam_id] = loads.index(min(loads))
+        return self.affinity[cam_id]
+
+    def _preload(self, worker, cam_id):
+        worker.statuses[cam_id] = "loading"
+        worker.send(("preload", cam_id))
+
+    def _worker_for(self, cam_id):
+        with self._lock:
+            index = self._assign(cam_id)
+            worker = self.workers[index]
+            if not worker.alive:
+                print(f">>> Khởi động lại tiến trình AI {index}")
+                worker.proc.wait()
+                worker = self.workers[index] = self._spawn(index)
+                self.restarts += 1
+                for cam, i in self.affinity.items():
+                    if i == index: self._preload(worker, cam)
+                raise RuntimeError(f"Tiến trình AI {index} đang khởi động lại")
+            self._req_id += 1
+            return worker, self._req_id
+
+    def submit(self, cam_id, frame, draw=True):
+        """Gửi 1 frame tới tiến trình phụ trách camera, trả về Future của (frame đã vẽ, user, cử chỉ, thống kê)
+        draw=False: không có client xem -> tiến trình con không vẽ và không gửi frame về (trả về None)"""
+        worker, req_id = self._worker_for(cam_id)
+        return worker.send(("frame", req_id, cam_id, frame, draw), req_id)
+
+    def status(self, cam_id):
+        """Trạng thái model của camera: loading / ready / failed, restarting khi tiến trình con đã chết"""
+        index = self.affinity.get(cam_id)
+        if index is None: return "pending"
+        worker = self.workers[index]
+        if not worker.alive: return "restarting"
+        return worker.statuses.get(cam_id, "loading")
+
+    def reload_database(self):
+        """Báo mọi tiến trình nạp lại face DB (sau khi đăng ký / xóa người dùng)"""
+        for worker in self.workers:
+            if worker.alive: worker.send(("reload",))
+
+    def proxy(self, cam_id):
+        """Đại diện SmartHomeAI cho 1 camera; tiến trình phụ trách bắt đầu nạp model ngay"""
+        with self._lock: self._preload(self.workers[self._assign(cam_id)], cam_id)
+        return RemoteAI(self, cam_id)
+
+    def close(self):
+        for worker in self.workers:
+            try: worker.send(("stop",))
+            except OSError: pass
+        for worker in self.workers:
+            try: worker.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired: worker.proc.kill()
+        self._listener.close()
+
+
+class RemoteAI:
+    """Đứng thay SmartHomeAI trong FramePipeline: process_frame chạy ở tiến trình con"""
+
+    def __init__(self, pool, cam_id):
+        self.pool = pool
+        self.cam_id = cam_id
+        self.last_stats = {}
+        self._future = None  # Yêu cầu gần nhất (có thể vẫn đang chạy sau khi quá timeout)
+
+    @property
+    def status(self):
+        return self.pool.status(self.cam_id)
+
+    @property
+    def ready(self):
+        """Có thể gửi frame mới: model đã nạp xong và frame trước đã xử lý xong
+        (quá timeout thì không dồn thêm frame vào hàng đợi của tiến trình con)"""
+        if self._future is not None and not self._future.done(): return False
+        return self.status in ("ready", "restarting")
+
+    def process_frame(self, frame, draw=True):
+        self._future = self.pool.submit(self.cam_id, frame, draw)
+        processed, user, gesture, self.last_stats = self._future.result(timeout=self.pool.timeout)
+        return processed, user, gesture
+
+    def stats(self):
+        return self.last_stats
+
+
+# ============= TIẾN TRÌNH CON =============
+def worker_main(address, authkey, index):
+    host, port = address.rsplit(":", 1)
+    conn = Client((host, int(port)), authkey=bytes.fromhex(authkey))
+    # Import sau khi kết nối: lỗi import (thiếu thư viện...) sẽ hiện ra là tiến trình chết, không treo server
+    from ai_core import SmartHomeAI
+
+    ais = {}  # id camera -> SmartHomeAI riêng
+    while True:
+        try: msg = conn.recv()
+        except (EOFError, OSError): break
+        kind = msg[0]
+        if kind == "stop": break
+        if kind == "reload":
+            for ai in ais.values(): ai.reload_database()
+            continue
+        if kind == "preload":
+            # Nạp model + chạy thử trước khi nhận frame, báo trạng thái về tiến trình chính
+            cam_id = msg[1]
+            ai = ais.get(cam_id)
+            if ai is None: ai = ais[cam_id] = SmartHomeAI(lazy=True)
+            try:
+                ai.load(warm_up=True)
+                conn.send(("status", cam_id, "ready", None))
+            except Exception as e:
+                conn.send(("status", cam_id, "failed", str(e)))
+            continue
+        _, req_id, cam_id, frame, draw = msg
+        try:
+            ai = ais.get(cam_id)
+            if ai is None: ai = ais[cam_id] = SmartHomeAI()
+            processed, user, gesture = ai.process_frame(frame, draw)
+            conn.send(("result", req_id, processed if draw else None, user, gesture, ai.stats()))
+        except Exception as e:
+            conn.send(("error", req_id, f"Lỗi AI tiến trình {index}: {e}"))
+    conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        worker_main(sys.argv[2], sys.argv[3], sys.argv[4])
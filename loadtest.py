@@ -0,0 +1,233 @@
+"""
+Test tải end-to-end cho web Smart Home (không cần webcam, không gọi IFTTT thật)
+
+Chức năng:
+- Nhiều client xem /video_feed cùng lúc (chọn profile), đo FPS + băng thông thực nhận của từng client
+- Nhiều client gọi /status, /toggle_device, /get_analytics song song
+- Báo cáo số request/giây, độ trễ p50/p90/p99/max, lỗi của từng endpoint
+- Theo dõi số luồng + RAM của server (đọc /metrics) từ đầu đến cuối để thấy rò rỉ / tăng trưởng
+- Ghi kết quả ra JSON để so sánh giữa các lần chạy
+
+Chuẩn bị (camera giả + webhook giả):
+    cameras_load.json: {"workers": 0, "cameras": [{"id": "cam0", "source": "synthetic:640x480@15"}]}
+    python stub_webhook.py --port 8080 --delay 0.05
+    SMARTHOME_CAMERA_FILE=cameras_load.json SMARTHOME_WEBHOOK_URL="http://127.0.0.1:8080/{event}" python app.py
+
+Ví dụ:
+    python loadtest.py --duration 60 --viewers 8 --profile low --pollers 10 --togglers 2 --analytics 1
+    python loadtest.py --viewers 20 --pollers 0 --togglers 0 --analytics 0 --webhook-stats http://127.0.0.1:8080/stats
+"""
+import argparse
+import datetime
+import json
+import threading
+import time
+
+import requests
+
+BOUNDARY = b"--frame\r\n"
+
+
+class Recorder:
+    """Độ trễ (giây) + số lỗi theo từng endpoint, dùng chung cho mọi luồng"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            if ok: self.latencies.setdefault(endpoint, []).append(seconds)
+            else: self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def summarize(recorder, elapsed):
+    report = {}
+    for endpoint in sorted(set(recorder.latencies) | set(recorder.errors)):
+        ms = [v * 1000 for v in recorder.latencies.get(endpoint, [])]
+        report[endpoint] = {
+            "count": len(ms),
+            "errors": recorder.errors.get(endpoint, 0),
+            "per_second": round(len(ms) / elapsed, 2),
+            "p50_ms": round(percentile(ms, 0.5), 2) if ms else None,
+            "p90_ms": round(percentile(ms, 0.9), 2) if ms else None,
+            "p99_ms": round(percentile(ms, 0.99), 2) if ms else None,
+            "max_ms": round(max(ms), 2) if ms else None,
+        }
+    return report
+
+
+# ============= CÁC LOẠI CLIENT =============
+def viewer(base, path, stop, recorder, result):
+    """1 client MJPEG: đếm frame theo boundary, giữ kết nối đến khi hết giờ (rớt thì kết nối lại)"""
+    session = requests.Session()
+    frames, nbytes, first_frame = 0, 0, None
+    start = time.perf_counter()
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            with session.get(base + path, stream=True, timeout=(5, 10)) as resp:
+                resp.raise_for_status()
+                tail = b""
+                for chunk in resp.iter_content(chunk_size=65536):
+                    data = tail + chunk
+                    found = data.count(BOUNDARY)
+                    if found and first_frame is None:
+                        first_frame = time.perf_counter() - t0
+                        recorder.record("video_feed_first_frame", first_frame, True)
+                    frames += found
+                    nbytes += len(chunk)
+                    tail = data[-(len(BOUNDARY) - 1):]
+                    if stop.is_set(): break
+        except requests.RequestException:
+            recorder.record("video_feed", 0, False)
+            stop.wait(1.0)
+    elapsed = time.perf_counter() - start
+    result.update({"frames": frames, "fps": round(frames / elapsed, 2), "kbps": round(nbytes * 8 / 1000 / elapsed, 1),
+                   "first_frame_ms": round(first_frame * 1000, 1) if first_frame is not None else None})
+
+
+def request_loop(name, stop, recorder, interval, call):
+    session = requests.Session()
+    i = 0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            resp = call(session, i)
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            ok = False
+        recorder.record(name, time.perf_counter() - t0, ok)
+        i += 1
+        if interval: stop.wait(interval)
+
+
+# ============= THEO DÕI SERVER (/metrics) =============
+def read_process_metrics(base):
+    """(số luồng, RSS byte) của tiến trình web, None nếu không đọc được"""
+    try: text = requests.get(base + "/metrics", timeout=5).text
+    except requests.RequestException: return None
+    values = {}
+    for line in text.splitlines():
+        for key in ("smarthome_process_threads", "smarthome_process_resident_memory_bytes"):
+            if line.startswith(key + " "): values[key] = float(line.split()[1])
+    if len(values) < 2: return None
+    return values["smarthome_process_threads"], values["smarthome_process_resident_memory_bytes"]
+
+
+def sampler(base, stop, samples, interval):
+    start = time.perf_counter()
+    while True:
+        value = read_process_metrics(base)
+        if value: samples.append((round(time.perf_counter() - start, 1),) + value)
+        if stop.wait(interval): break
+    value = read_process_metrics(base)
+    if value: samples.append((round(time.perf_counter() - start, 1),) + value)
+
+
+def growth(samples):
+    if not samples: return None
+    threads, rss = [s[1] for s in samples], [s[2] / (1024 * 1024) for s in samples]
+    return {"threads_start": int(threads[0]), "threads_end": int(threads[-1]), "threads_max": int(max(threads)),
+            "rss_mb_start": round(rss[0], 1), "rss_mb_end": round(rss[-1], 1), "rss_mb_max": round(max(rss), 1)}
+
+
+# ============= CHẠY =============
+def run(args):
+    base = args.url.rstrip("/")
+    status = requests.get(base + "/status", timeout=10).json()
+    device_ids = [d["id"] for d in status["devices"]]
+    feed_path = (f"/video_feed/{args.camera}" if args.camera else "/video_feed") + f"?profile={args.profile}"
+
+    stop = threading.Event()
+    recorder = Recorder()
+    viewers = [{} for _ in range(args.viewers)]
+    samples = []
+    threads = [threading.Thread(target=sampler, args=(base, stop, samples, args.sample_interval), daemon=True)]
+    threads += [threading.Thread(target=viewer, args=(base, feed_path, stop, recorder, v), daemon=True) for v in viewers]
+
+    def toggle(session, i):
+        data = {"device_id": device_ids[i % len(device_ids)], "action": "ON" if (i // len(device_ids)) % 2 == 0 else "OFF"}
+        return session.post(base + "/toggle_device", data=data, timeout=10)
+
+    loops = [("status", args.pollers, args.poll_interval, lambda s, i: s.get(base + "/status", timeout=10)),
+             ("toggle_device", args.togglers if device_ids else 0, args.toggle_interval, toggle),
+             ("get_analytics", args.analytics, args.analytics_interval, lambda s, i: s.get(base + "/get_analytics", timeout=30))]
+    for name, count, interval, call in loops:
+        threads += [threading.Thread(target=request_loop, args=(name, stop, recorder, interval, call), daemon=True)
+                    for _ in range(count)]
+
+    print(f">>> {args.viewers} viewer ({args.profile}), {args.pollers} /status, {args.togglers} /toggle_device, "
+          f"{args.analytics} /get_analytics trong {args.duration}s")
+    start = time.perf_counter()
+    for t in threads: t.start()
+    try: stop.wait(args.duration)
+    except KeyboardInterrupt: pass
+    stop.set()
+    for t in threads: t.join(timeout=15)
+    elapsed = time.perf_counter() - start
+
+    stub = None
+    if args.webhook_stats:
+        try: stub = requests.get(args.webhook_stats, timeout=5).json()
+        except requests.RequestException: pass
+    fps = [v["fps"] for v in viewers if "fps" in v]
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "url": base,
+        "seconds": round(elapsed, 1),
+        "clients": {"viewers": args.viewers, "profile": args.profile, "pollers": args.pollers,
+                    "togglers": args.togglers, "analytics": args.analytics},
+        "endpoints": summarize(recorder, elapsed),
+        "stream": {"per_client": viewers, "fps_min": min(fps) if fps else None,
+                   "fps_mean": round(sum(fps) / len(fps), 2) if fps else None},
+        "server": growth(samples),
+        "server_samples": samples,
+        "webhook_stub": stub,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test tải end-to-end cho web Smart Home")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Địa chỉ app.py đang chạy")
+    parser.add_argument("--duration", type=float, default=30, help="Thời gian chạy (giây)")
+    parser.add_argument("--viewers", type=int, default=4, help="Số client xem /video_feed")
+    parser.add_argument("--profile", default="medium", help="Profile video (high / medium / low)")
+    parser.add_argument("--camera", default=None, help="Id camera (mặc định camera đầu tiên)")
+    parser.add_argument("--pollers", type=int, default=4, help="Số client gọi /status")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Giây giữa 2 lần gọi /status của 1 client (0 = liên tục)")
+    parser.add_argument("--togglers", type=int, default=1, help="Số client gọi /toggle_device")
+    parser.add_argument("--toggle-interval", type=float, default=0.5)
+    parser.add_argument("--analytics", type=int, default=1, help="Số client gọi /get_analytics")
+    parser.add_argument("--analytics-interval", type=float, default=2.0)
+    parser.add_argument("--sample-interval", type=float, default=2.0, help="Giây giữa 2 lần đọc luồng / RAM server")
+    parser.add_argument("--webhook-stats", default=None, help="URL /stats của stub_webhook.py (đếm lệnh gửi đi)")
+    parser.add_argument("--out", default="loadtest_result.json", help="File JSON kết quả")
+    args = parser.parse_args()
+
+    result = run(args)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=4)
+
+    print(f">>> Xong sau {result['seconds']}s")
+    for name, st in result["endpoints"].items():
+        print(f"    {name:22s} {st['per_second']:8.2f} req/s | p50 {st['p50_ms']} ms | p90 {st['p90_ms']} ms | "
+              f"p99 {st['p99_ms']} ms | max {st['max_ms']} ms | lỗi {st['errors']}")
+    stream = result["stream"]
+    print(f"    video: FPS trung bình {stream['fps_mean']}, thấp nhất {stream['fps_min']} / client")
+    if result["server"]:
+        s = result["server"]
+        print(f"    server: luồng {s['threads_start']} -> {s['threads_end']} (max {s['threads_max']}), "
+              f"RAM {s['rss_mb_start']} -> {s['rss_mb_end']} MB (max {s['rss_mb_max']})")
+    if result["webhook_stub"]: print(f"    webhook giả lập: {result['webhook_stub']}")
+    print(f">>> Đã ghi {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Module đo thời gian từng bước xử lý (stage) + xuất metrics kiểu Prometheus
+Khi không gắn bộ ghi (timer = None) thì mỗi stage chỉ tốn 1 lần kiểm tra None.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+
+class _Stage:
+    __slots__ = ("sink", "name", "start")
+
+    def __init__(self, sink, name):
+        self.sink, self.name = sink, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.sink.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+NULL_STAGE = _NullStage()
+
+
+def stage(sink, name):
+    """with stage(timer, "detect"): ...  (timer = None -> không đo gì)"""
+    return NULL_STAGE if sink is None else _Stage(sink, name)
+
+
+class SampleRecorder:
+    """Lưu toàn bộ mẫu thời gian (giây) theo từng stage, dùng cho benchmark offline"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def observe(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+
+class PhaseTimer:
+    """Thời gian các giai đoạn khởi động
+    - mark(tên): giai đoạn tính từ lần mark trước (dùng cho code chạy tuần tự ở cấp module)
+    - observe(tên, giây): dùng làm sink cho stage() (vd: nạp model ở luồng nền)
+    """
+
+    def __init__(self):
+        self.start = self._last = time.perf_counter()
+        self.phases = []  # [(tên, giây, thời điểm xong tính từ lúc bắt đầu)]
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock: self.phases.append((name, seconds, time.perf_counter() - self.start))
+
+    def mark(self, name):
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((name, now - self._last, now - self.start))
+            self._last = now
+
+    def to_dict(self):
+        with self._lock: return {name: round(seconds, 3) for name, seconds, _ in self.phases}
+
+    def report(self):
+        with self._lock: phases = list(self.phases)
+        lines = [f"    {name:<20} {seconds * 1000:8.1f} ms   (xong lúc {at:6.2f}s)" for name, seconds, at in phases]
+        return "\n".join([">>> Thời gian khởi động:"] + lines)
+
+
+# Mốc thời gian khởi động của tiến trình (import metrics sớm để tính cả thời gian import)
+STARTUP = PhaseTimer()
+
+
+def process_rss_bytes():
+    """RAM đang dùng của tiến trình (byte), NaN nếu hệ điều hành không hỗ trợ"""
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss
+        except Exception:
+            return float("nan")
+
+
+# ============= PROMETHEUS METRICS (/metrics) =============
+# Ranh giới bucket (giây) cho histogram thời gian stage
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _labels_text(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """Histogram cộng dồn (cho Prometheus) + cửa sổ trượt các mẫu gần nhất (để xem phân vị hiện tại)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=512):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()  # Nhiều pipeline (camera) cùng ghi 1 stage
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def snapshot(self):
+        """(counts, sum, count) nhất quán với nhau để xuất /metrics"""
+        with self._lock: return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        with self._lock: values = sorted(self.recent)
+        if not values: return float("nan")
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="smarthome", enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self.stages = {}      # Tên stage -> Histogram
+        self.counters = {}    # (tên, nhãn) -> giá trị
+        self.gauges = {}      # (tên, nhãn) -> hàm trả về giá trị (chỉ gọi khi có người đọc /metrics)
+        self.help = {}
+        self._lock = threading.Lock()
+
+    @property
+    def sink(self):
+        """Giá trị gán cho thuộc tính timer của SmartHomeAI / pipeline (None khi tắt metrics)"""
+        return self if self.enabled else None
+
+    # Dùng được làm timer cho SmartHomeAI / pipeline: observe(tên stage, giây)
+    def observe(self, name, seconds):
+        hist = self.stages.get(name)
+        if hist is None:
+            with self._lock: hist = self.stages.setdefault(name, Histogram())
+        hist.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled: return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock: self.counters[key] = self.counters.get(key, 0) + amount
+
+    def counter(self, name, fn, help_text="", **labels):
+        """Counter đọc từ 1 bộ đếm có sẵn (vd: số frame bị bỏ trong hàng đợi), không tốn gì khi chạy"""
+        self.counters[(name, tuple(sorted(labels.items())))] = fn
+        if help_text: self.help[name] = help_text
+
+    def gauge(self, name, fn, help_text="", **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = fn
+        if help_text: self.help[name] = help_text
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def render(self):
+        """Xuất dạng text Prometheus (exposition format 0.0.4)"""
+        p, lines = self.prefix, []
+        with self._lock: stages = sorted(self.stages.items())
+        name = f"{p}_stage_seconds"
+        lines += [f"# HELP {name} Thời gian xử lý từng stage", f"# TYPE {name} histogram"]
+        for stage_name, hist in stages:
+            counts, total, count = hist.snapshot()
+            cumulative = 0
+            for bound, c in zip(self.buckets_of(hist), counts):
+                cumulative += c
+                lines.append(f'{name}_bucket{{stage="{stage_name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage_name}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage_name}"}} {count}')
+        name = f"{p}_stage_recent_seconds"
+        lines += [f"# HELP {name} Phân vị thời gian trên cửa sổ các mẫu gần nhất", f"# TYPE {name} gauge"]
+        for stage_name, hist in stages:
+            for q in (0.5, 0.9, 0.99):
+                lines.append(f'{name}{{stage="{stage_name}",quantile="{q}"}} {hist.quantile(q):.6f}')
+
+        with self._lock: tables = (("counter", list(self.counters.items())), ("gauge", list(self.gauges.items())))
+        for kind, table in tables:
+            seen = set()
+            for (metric, labels), value in sorted(table, key=lambda kv: kv[0]):
+                full = f"{p}_{metric}"
+                if metric not in seen:
+                    seen.add(metric)
+                    if metric in self.help: lines.append(f"# HELP {full} {self.help[metric]}")
+                    lines.append(f"# TYPE {full} {kind}")
+                if callable(value):
+                    try: value = value()
+                    except Exception: continue
+                lines.append(f"{full}{_labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def buckets_of(hist):
+        return [str(b) for b in hist.buckets] + ["+Inf"]
+
+
+# Registry dùng chung cho cả ứng dụng. Tắt bằng biến môi trường SMARTHOME_METRICS=0
+REGISTRY = MetricsRegistry(enabled=os.environ.get("SMARTHOME_METRICS", "1") != "0")
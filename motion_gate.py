@@ -0,0 +1,74 @@
+"""
+Module cổng chuyển động (motion gate) để tiết kiệm CPU khi phòng không có ai cử động
+- Mỗi frame được thu nhỏ (mặc định rộng 64px, ảnh xám, làm mờ) rồi so với ảnh nền trung bình trượt
+- Có chuyển động: chạy AI đầy đủ mọi frame (chế độ "active")
+- Không có chuyển động trong idle_after giây: chuyển sang "idle", AI chỉ chạy mỗi idle_interval giây
+- Frame nào có chuyển động thì chạy AI ngay ở chính frame đó (thức dậy trong 1 frame)
+Chi phí mỗi frame: 1 lần resize + vài phép tính trên ảnh 64x48, không đáng kể so với YuNet/SFace/MediaPipe.
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, width=64, pixel_threshold=12, min_area=0.004, idle_after=10.0, idle_interval=2.0,
+                 learning_rate=0.05, clock=time.monotonic):
+        self.width = width                      # Chiều rộng ảnh thu nhỏ để so sánh
+        self.pixel_threshold = pixel_threshold  # Chênh lệch độ sáng (0-255) để coi 1 điểm ảnh là "đổi"
+        self.min_area = min_area                # Tỉ lệ điểm ảnh đổi tối thiểu để coi là có chuyển động
+        self.idle_after = idle_after            # Bao lâu không chuyển động thì sang idle (giây)
+        self.idle_interval = idle_interval      # Ở idle vẫn chạy AI mỗi bấy nhiêu giây (người ngồi yên)
+        self.learning_rate = learning_rate      # Tốc độ cập nhật ảnh nền (ánh sáng thay đổi từ từ)
+        self.clock = clock
+
+        self.mode = "active"
+        self.score = 0.0
+        self.transitions = 0
+        self.mode_seconds = {"active": 0.0, "idle": 0.0}
+        self._background = None
+        self._last_motion = self._mode_since = self._last_run = clock()
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3: small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+    def motion(self, frame):
+        """Tỉ lệ điểm ảnh khác ảnh nền (0..1), đồng thời cập nhật ảnh nền"""
+        small = self._small(frame)
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small
+            return 1.0
+        changed = np.count_nonzero(cv2.absdiff(small, self._background) > self.pixel_threshold) / small.size
+        cv2.accumulateWeighted(small, self._background, self.learning_rate)
+        return changed
+
+    def _set_mode(self, mode, now):
+        if mode == self.mode: return
+        self.mode_seconds[self.mode] += now - self._mode_since
+        self.mode, self._mode_since = mode, now
+        self.transitions += 1
+
+    def should_process(self, frame):
+        """True nếu frame này cần chạy AI"""
+        now = self.clock()
+        self.score = self.motion(frame)
+        if self.score >= self.min_area:
+            self._last_motion = now
+            self._set_mode("active", now)
+        elif now - self._last_motion >= self.idle_after:
+            self._set_mode("idle", now)
+
+        if self.mode == "idle" and now - self._last_run < self.idle_interval: return False
+        self._last_run = now
+        return True
+
+    def stats(self):
+        now = self.clock()
+        seconds = dict(self.mode_seconds)
+        seconds[self.mode] += now - self._mode_since
+        return {"mode": self.mode, "motion": round(self.score, 4), "transitions": self.transitions,
+                "active_seconds": round(seconds["active"], 1), "idle_seconds": round(seconds["idle"], 1)}
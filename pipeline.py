@@ -0,0 +1,200 @@
+"""
+Module pipeline video cho Smart Home
+Tách chuỗi xử lý thành 3 luồng chạy nền: Camera -> AI -> Mã hóa JPEG.
+Các luồng nối với nhau bằng hàng đợi "frame mới nhất thắng" (bounded),
+kết quả JPEG được phát chung cho mọi client đang xem /video_feed.
+- Profile phát (STREAM_PROFILES): độ rộng ảnh + chất lượng JPEG + FPS tối đa, chọn bằng /video_feed?profile=
+- Mỗi biến thể (độ rộng, chất lượng) chỉ mã hóa 1 lần / frame, dùng chung cho mọi client cùng biến thể
+- Không có client nào: bỏ qua vẽ và mã hóa JPEG, AI vẫn chạy để điều khiển thiết bị
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from metrics import stage
+
+# width None = giữ nguyên độ phân giải camera, fps None = không giới hạn (theo tốc độ AI)
+STREAM_PROFILES = {
+    "high": {"width": None, "quality": 90, "fps": None},
+    "medium": {"width": 640, "quality": 75, "fps": 15},
+    "low": {"width": 320, "quality": 60, "fps": 5},
+}
+DEFAULT_PROFILE = "high"
+
+
+class LatestQueue:
+    """Hàng đợi có giới hạn: khi đầy thì bỏ frame cũ nhất, giữ frame mới nhất"""
+
+    def __init__(self, maxsize=1):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen: self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Lấy phần tử cũ nhất còn trong hàng đợi, trả về None nếu hết thời gian chờ"""
+        with self._cond:
+            if not self._items: self._cond.wait(timeout)
+            if not self._items: return None
+            return self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FramePipeline:
+    def __init__(self, camera, ai, on_result=None, profiles=None, timer=None, gate=None):
+        self.camera = camera
+        self.ai = ai
+        self.on_result = on_result  # Callback(user, gesture) chạy 1 lần / frame, không phụ thuộc số client
+        self.profiles = profiles or STREAM_PROFILES
+        self.timer = timer          # Bộ ghi thời gian stage (xem metrics.py), None = tắt
+        self.gate = gate            # Cổng chuyển động (xem motion_gate.py), None = luôn chạy AI
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0     # Frame không chạy AI vì phòng đang yên (idle)
+        self.last_capture = None    # Thời điểm (monotonic) đọc được frame gần nhất, None = chưa có
+        self.errors = 0
+        self.clients = 0
+        self.jpeg_encodes = 0       # Số lần mã hóa JPEG (mọi biến thể)
+
+        self.infer_q = LatestQueue()
+        self.encode_q = LatestQueue()
+
+        # Frame gốc mới nhất (dùng cho /register thay vì gọi camera.read() lần 2)
+        self._raw_lock = threading.Lock()
+        self._raw_frame = None
+
+        # JPEG mới nhất của từng biến thể + số thứ tự để các client biết khi nào có frame mới
+        self._out_cond = threading.Condition()
+        self._variant_clients = {}  # (width, quality) -> số client đang xem
+        self._jpegs = {}            # (width, quality) -> JPEG của frame số _seq
+        self._seq = 0
+
+        self._running = False
+        self._threads = []
+
+    # ============= ĐIỀU KHIỂN =============
+    def start(self):
+        if self._running: return
+        self._running = True
+        for target, name in ((self._capture_loop, "capture"), (self._infer_loop, "infer"), (self._encode_loop, "encode")):
+            t = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._running = False
+        with self._out_cond: self._out_cond.notify_all()
+        for t in self._threads: t.join(timeout=2)
+        self._threads = []
+
+    def frame_age(self):
+        """Số giây từ frame gần nhất (None = camera chưa gửi frame nào)"""
+        return None if self.last_capture is None else time.monotonic() - self.last_capture
+
+    def latest_frame(self):
+        with self._raw_lock:
+            return None if self._raw_frame is None else self._raw_frame.copy()
+
+    # ============= CÁC LUỒNG XỬ LÝ =============
+    def _capture_loop(self):
+        while self._running:
+            with stage(self.timer, "capture"):
+                success, frame = self.camera.read()
+            if not success:
+                time.sleep(0.1)
+                continue
+            self.frames_captured += 1
+            self.last_capture = time.monotonic()
+            with self._raw_lock: self._raw_frame = frame
+            self.infer_q.put(frame)
+
+    def _infer_loop(self):
+        while self._running:
+            frame = self.infer_q.get(timeout=0.5)
+            if frame is None: continue
+            if not self.ai.ready:
+                # Model AI còn đang nạp (hoặc frame trước còn đang xử lý ở tiến trình con): vẫn phát hình gốc
+                if self.clients: self.encode_q.put(frame)
+                continue
+            if self.gate:
+                with stage(self.timer, "motion"):
+                    run_ai = self.gate.should_process(frame)
+                if not run_ai:
+                    # Không chuyển động: vẫn phát hình gốc, bỏ qua YuNet/SFace/MediaPipe
+                    self.frames_skipped += 1
+                    if self.clients: self.encode_q.put(frame)
+                    continue
+            draw = self.clients > 0
+            try:
+                with stage(self.timer, "infer"):
+                    processed_frame, user, gesture = self.ai.process_frame(frame, draw=draw)
+                with stage(self.timer, "dispatch"):
+                    if self.on_result: self.on_result(user, gesture)
+            except Exception as e:
+                self.errors += 1
+                print(f"Lỗi pipeline AI: {e}")
+                continue
+            self.frames_processed += 1
+            if draw: self.encode_q.put(processed_frame)
+
+    @staticmethod
+    def _resize(frame, width):
+        h, w = frame.shape[:2]
+        if not width or w <= width: return frame
+        return cv2.resize(frame, (width, max(1, h * width // w)), interpolation=cv2.INTER_AREA)
+
+    def _encode_loop(self):
+        while self._running:
+            frame = self.encode_q.get(timeout=0.5)
+            if frame is None: continue
+            with self._out_cond: variants = list(self._variant_clients)
+            if not variants: continue  # Client cuối vừa ngắt kết nối
+            jpegs, resized = {}, {}
+            with stage(self.timer, "encode"):
+                for width, quality in variants:
+                    if width not in resized: resized[width] = self._resize(frame, width)
+                    ret, buffer = cv2.imencode('.jpg', resized[width], [cv2.IMWRITE_JPEG_QUALITY, quality])
+                    if ret: jpegs[(width, quality)] = buffer.tobytes()
+            self.jpeg_encodes += len(jpegs)
+            with self._out_cond:
+                self._jpegs = jpegs
+                self._seq += 1
+                self._out_cond.notify_all()
+
+    # ============= PHÁT CHO CLIENT =============
+    def stream(self, profile=DEFAULT_PROFILE):
+        """Generator MJPEG cho 1 client: luôn gửi frame mới nhất, bỏ qua frame cũ nếu client chậm
+        hoặc nếu đến sớm hơn FPS tối đa của profile (không bao giờ làm chậm luồng AI)"""
+        config = self.profiles[profile]
+        variant = (config.get("width"), config.get("quality", 90))
+        interval = 1.0 / config["fps"] if config.get("fps") else 0.0
+        last_seq, next_send = 0, 0.0
+        with self._out_cond:
+            self.clients += 1
+            self._variant_clients[variant] = self._variant_clients.get(variant, 0) + 1
+        try:
+            while self._running:
+                delay = next_send - time.monotonic()
+                if delay > 0: time.sleep(delay)
+                with self._out_cond:
+                    self._out_cond.wait_for(lambda: (self._seq != last_seq and variant in self._jpegs) or not self._running,
+                                            timeout=1.0)
+                    jpeg = self._jpegs.get(variant)
+                    if self._seq == last_seq or jpeg is None: continue
+                    last_seq = self._seq
+                next_send = time.monotonic() + interval
+                yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            with self._out_cond:
+                self.clients -= 1
+                self._variant_clients[variant] -= 1
+                if not self._variant_clients[variant]: del self._variant_clients[variant]
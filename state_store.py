@@ -0,0 +1,179 @@
+"""
+Module lưu trạng thái thiết bị (devices.json) và sở thích cá nhân (user_prefs.json)
+- Dữ liệu nằm trong RAM, mọi thay đổi đi qua 1 khóa (an toàn giữa các luồng Flask và pipeline)
+- Ghi xuống đĩa được gộp (debounce): bật/tắt liên tục chỉ ghi 1 lần sau khi yên lặng
+- Ghi nguyên tử: file tạm + fsync + os.replace, không bao giờ để lại file JSON ghi dở
+- Mỗi thay đổi tăng số phiên bản (version) để client biết khi nào cần tải lại
+- Tra thiết bị theo id O(1), chỉ mục cử chỉ -> hành động chỉ dựng lại khi cấu hình đổi
+"""
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+
+from dispatch_index import DispatchIndex
+from metrics import stage
+
+
+def load_json(path, default):
+    """Đọc file JSON, file hỏng được đổi tên thành .corrupt rồi dùng giá trị mặc định"""
+    if not os.path.exists(path): return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+    except Exception as e:
+        print(f"Lỗi đọc {path}: {e}, chuyển sang {path}.corrupt")
+        try: os.replace(path, path + ".corrupt")
+        except OSError: pass
+        return default
+
+
+def write_json_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class StateStore:
+    def __init__(self, device_file="devices.json", pref_file="user_prefs.json", default_devices=None,
+                 debounce=0.5, max_delay=3.0, timer=None):
+        self.files = {"devices": device_file, "user_prefs": pref_file}
+        self.debounce = debounce    # Ghi khi đã yên lặng bấy nhiêu giây...
+        self.max_delay = max_delay  # ...nhưng không để dữ liệu chờ quá bấy nhiêu giây
+        self.timer = timer
+        self.lock = threading.RLock()
+        self.version = 0
+        self.config_version = 0  # Chỉ tăng khi luật điều khiển đổi (không tính bật/tắt thiết bị)
+        self.writes = 0
+        self.index = DispatchIndex()
+        self.listeners = []      # Hàm (loại, dữ liệu) được gọi sau mỗi thay đổi (vd: đẩy sự kiện cho dashboard)
+
+        self.devices = load_json(device_file, None)
+        self.prefs = load_json(pref_file, {})
+        self._dirty = set()
+        if self.devices is None:
+            self.devices = copy.deepcopy(default_devices or [])
+            self._dirty.add("devices")
+        self._by_id = {dev["id"]: dev for dev in self.devices}
+
+        self._cond = threading.Condition(self.lock)
+        self._write_lock = threading.Lock()  # Không để 2 lần flush ghi chéo nhau (bản cũ đè bản mới)
+        self._last_change = 0.0
+        self._running = True
+        self._thread = threading.Thread(target=self._writer_loop, name="state-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ============= THIẾT BỊ =============
+    def get_device(self, dev_id):
+        return self._by_id.get(dev_id)
+
+    def devices_snapshot(self):
+        with self.lock: return copy.deepcopy(self.devices)
+
+    def set_status(self, dev_id, status):
+        """Đổi trạng thái, trả về thiết bị nếu có thay đổi, None nếu không tìm thấy / đã đúng trạng thái"""
+        with self.lock:
+            dev = self.get_device(dev_id)
+            if dev is None or dev["status"] == status: return None
+            dev["status"] = status
+            self._changed("devices", event=("device", {"id": dev_id, "status": status}))
+            return dev
+
+    def add_device(self, dev):
+        with self.lock:
+            if self.get_device(dev["id"]) is not None: return False
+            self.devices.append(dev)
+            self._by_id[dev["id"]] = dev
+            self._changed("devices", config=True, event=("device_added", copy.deepcopy(dev)))
+            return True
+
+    def delete_device(self, dev_id):
+        with self.lock:
+            if self._by_id.pop(dev_id, None) is None: return False
+            self.devices = [d for d in self.devices if d["id"] != dev_id]
+            self._changed("devices", config=True, event=("device_removed", {"id": dev_id}))
+            return True
+
+    # ============= SỞ THÍCH CÁ NHÂN =============
+    def prefs_of(self, user):
+        with self.lock: return copy.deepcopy(self.prefs.get(user, {}))
+
+    def set_pref(self, user, dev_id, on_gesture, off_gesture):
+        with self.lock:
+            self.prefs.setdefault(user, {})[dev_id] = {"on": on_gesture, "off": off_gesture}
+            self._changed("user_prefs", config=True, event=("prefs", {"user": user}))
+
+    def delete_user(self, user):
+        with self.lock:
+            if user not in self.prefs: return False
+            del self.prefs[user]
+            self._changed("user_prefs", config=True, event=("prefs", {"user": user}))
+            return True
+
+    # ============= ĐIỀU PHỐI CỬ CHỈ =============
+    def actions_for(self, user, gesture, room=None):
+        """(người dùng, cử chỉ, phòng) -> ([(id thiết bị, hành động)], phương thức)"""
+        with self.lock:
+            if self.index.version != self.config_version:
+                self.index.rebuild(self.devices, self.prefs, self.config_version)
+            return self.index.lookup(user, gesture, room)
+
+    # ============= GHI XUỐNG ĐĨA =============
+    def _changed(self, name, config=False, event=None):
+        # Gọi khi đang giữ self.lock
+        self.version += 1
+        if config: self.config_version += 1
+        self._dirty.add(name)
+        self._last_change = time.monotonic()
+        self._cond.notify()
+        if event:
+            for listener in self.listeners: listener(*event)
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or not self._running)
+                if not self._running: return
+                # Gộp các thay đổi liên tiếp: chờ đến khi yên lặng đủ lâu hoặc hết max_delay
+                first = time.monotonic()
+                while self._running:
+                    now = time.monotonic()
+                    wait = min(self._last_change + self.debounce, first + self.max_delay) - now
+                    if wait <= 0: break
+                    self._cond.wait(wait)
+            if not self.flush(): time.sleep(1.0)  # Lỗi đĩa: chờ 1 chút rồi thử lại
+
+    def flush(self):
+        """Ghi ngay các file có thay đổi (chuỗi JSON được dựng trong khóa, ghi đĩa ngoài khóa)"""
+        ok = True
+        with self._write_lock:
+            with self.lock:
+                data = {"devices": self.devices, "user_prefs": self.prefs}
+                payloads = {name: json.dumps(data[name], ensure_ascii=False, indent=4) for name in self._dirty}
+                self._dirty.clear()
+            for name, text in payloads.items():
+                try:
+                    with stage(self.timer, f"save_{name}"):
+                        write_json_atomic(self.files[name], text)
+                    self.writes += 1
+                except Exception as e:
+                    print(f"Lỗi ghi {self.files[name]}: {e}")
+                    with self.lock: self._dirty.add(name)
+                    ok = False
+        return ok
+
+    def close(self):
+        if not self._running: return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        return {"version": self.version, "writes": self.writes, "dirty": sorted(self._dirty)}
@@ -0,0 +1,98 @@
+"""
+Server webhook giả lập thay cho IFTTT (test tải / chạy thử không gọi ra Internet)
+
+- Nhận mọi request GET/POST tới /<event>, trả 200 sau --delay giây
+- --fail-rate: tỉ lệ request trả lỗi 503 (kiểm tra cơ chế thử lại của WebhookDispatcher)
+- GET /stats: số request theo từng event + độ trễ xử lý, dùng cho loadtest.py
+
+Ví dụ:
+    python stub_webhook.py --port 8080 --delay 0.05 --fail-rate 0.1
+    SMARTHOME_WEBHOOK_URL="http://127.0.0.1:8080/{event}" python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, delay=0.0, fail_rate=0.0):
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.events = {}     # event -> số request
+        self.failed = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        """Trả về True nếu request này bị giả lập lỗi"""
+        failed = random.random() < self.fail_rate
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + 1
+            self.failed += failed
+        return failed
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.events.values())
+            return {"total": total, "failed": self.failed, "events": dict(self.events),
+                    "per_second": round(total / max(time.time() - self.started, 1e-6), 2)}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self):
+            if self.path == "/stats": return self._reply(200, state.stats())
+            length = int(self.headers.get("Content-Length") or 0)
+            if length: self.rfile.read(length)
+            event = self.path.strip("/").split("/")[0] or "root"
+            if state.delay: time.sleep(state.delay)
+            if state.record(event): return self._reply(503, {"status": "fail"})
+            self._reply(200, {"status": "ok", "event": event})
+
+        do_GET = do_POST = _handle
+
+        def log_message(self, *args):
+            pass  # Không in mỗi request (làm chậm khi test tải)
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8080, delay=0.0, fail_rate=0.0):
+    """Chạy server ở luồng nền, trả về (server, state); dừng bằng server.shutdown()"""
+    state = StubState(delay, fail_rate)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-webhook", daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server webhook giả lập (thay IFTTT khi test)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.0, help="Độ trễ giả lập mỗi request (giây)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Tỉ lệ request trả 503 (0..1)")
+    args = parser.parse_args()
+
+    server, state = serve(args.host, args.port, args.delay, args.fail_rate)
+    print(f">>> Webhook giả lập tại http://{args.host}:{args.port}/{{event}} (thống kê: /stats)")
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f">>> {state.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Module gửi lệnh IFTTT / webhook bất đồng bộ
+- Số luồng gửi cố định (không tạo 1 thread mới cho mỗi lệnh)
+- Dùng chung 1 requests.Session: giữ kết nối (keep-alive), không bắt tay TLS lại mỗi lần
+- Có timeout, thử lại có giới hạn với thời gian chờ tăng dần (backoff)
+- Gộp lệnh theo thiết bị: lệnh chưa kịp gửi bị lệnh mới hơn của cùng thiết bị thay thế
+  (bật rồi tắt liên tục chỉ gửi trạng thái cuối), mỗi thiết bị tối đa 1 lệnh đang gửi
+- URL đổi được (vd: trỏ sang server giả lập khi test)
+"""
+import atexit
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import stage
+
+
+class WebhookDispatcher:
+    def __init__(self, url_template, workers=4, timeout=(3.05, 5.0), retries=3, backoff=0.5, max_backoff=8.0,
+                 timer=None):
+        self.url_template = url_template  # Có thể chứa {event} và {device}
+        self.timeout = timeout            # (kết nối, đọc) giây
+        self.retries = retries            # Số lần thử lại tối đa sau lần gửi đầu
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timer = timer
+        self.outcomes = {"ok": 0, "http_error": 0, "error": 0, "retried": 0, "coalesced": 0}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cond = threading.Condition()
+        self._pending = {}      # id thiết bị -> tên sự kiện mới nhất chưa gửi
+        self._ready = deque()   # Thứ tự các thiết bị chờ gửi
+        self._inflight = set()  # Thiết bị đang có lệnh được gửi
+        self._running = True
+        self._threads = [threading.Thread(target=self._worker, name=f"webhook-{i}", daemon=True) for i in range(workers)]
+        for t in self._threads: t.start()
+        atexit.register(self.close)
+
+    # ============= API =============
+    def submit(self, device_id, event_name):
+        """Xếp lệnh vào hàng đợi, trả về ngay. Lệnh cũ chưa gửi của cùng thiết bị bị thay thế"""
+        with self._cond:
+            if device_id in self._pending:
+                self.outcomes["coalesced"] += 1
+            elif device_id not in self._inflight:
+                self._ready.append(device_id)
+                self._cond.notify()
+            self._pending[device_id] = event_name
+
+    def pending(self):
+        return len(self._pending)
+
+    def close(self, timeout=2.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads: t.join(timeout=timeout)
+        self.session.close()
+
+    def stats(self):
+        with self._cond:
+            return {**self.outcomes, "pending": len(self._pending), "inflight": len(self._inflight)}
+
+    def _count(self, outcome):
+        # Các luồng gửi cùng cộng bộ đếm, /metrics đọc song song -> giữ khóa của dispatcher
+        with self._cond: self.outcomes[outcome] += 1
+
+    # ============= LUỒNG GỬI =============
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ready or not self._running)
+                if not self._running: return
+                device_id = self._ready.popleft()
+                event_name = self._pending.pop(device_id)
+                self._inflight.add(device_id)
+            try:
+                self._send(device_id, event_name)
+            finally:
+                with self._cond:
+                    self._inflight.discard(device_id)
+                    # Có lệnh mới cho thiết bị này trong lúc đang gửi -> xếp hàng lại
+                    if device_id in self._pending:
+                        self._ready.append(device_id)
+                        self._cond.notify()
+
+    def _superseded(self, device_id):
+        return device_id in self._pending
+
+    def _send(self, device_id, event_name):
+        url = self.url_template.format(event=event_name, device=device_id)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Đã có lệnh mới hơn thì bỏ lệnh cũ, không thử lại nữa
+                if self._superseded(device_id) or not self._running:
+                    self._count("coalesced")
+                    return
+                self._count("retried")
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+            try:
+                with stage(self.timer, "ifttt"):
+                    resp = self.session.post(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Lỗi gửi webhook {event_name}: {e}")
+                outcome = "error"
+                continue
+            if resp.ok:
+                self._count("ok")
+                return
+            outcome = "http_error"
+            # Lỗi phía client (sai key, sai URL...) thì thử lại cũng vô ích
+            if resp.status_code < 500 and resp.status_code != 429: break
+        print(f"Gửi webhook {event_name} thất bại ({outcome})")
+        self._count(outcome)